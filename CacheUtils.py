@@ -0,0 +1,130 @@
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CACHE_MB = float(os.environ.get("ANALYTICS_CACHE_MB", 256))
+
+
+def _update_hash(digest, value):
+    if isinstance(value, pd.DataFrame):
+        digest.update(b'DataFrame')
+        digest.update(repr(list(value.columns)).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, pd.Series):
+        digest.update(b'Series')
+        digest.update(repr(value.name).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(f"ndarray{value.dtype}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}{len(value)}(".encode())
+        for item in value:
+            _update_hash(digest, item)
+        digest.update(b')')
+    elif isinstance(value, dict):
+        digest.update(f"dict{len(value)}(".encode())
+        for key in sorted(value, key=repr):
+            _update_hash(digest, key)
+            _update_hash(digest, value[key])
+        digest.update(b')')
+    elif hasattr(value, '__dict__') and not callable(value):
+        # plain objects such as samplers hash by their attributes rather than their default repr (which has an address)
+        digest.update(type(value).__name__.encode())
+        _update_hash(digest, vars(value))
+    else:
+        digest.update(f"{type(value).__name__}:{value!r}".encode())
+
+
+def content_hash(*values):
+    # hashes what the data contains, not object identity, so an identical panel loaded again still hits
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        _update_hash(digest, value)
+    return digest.hexdigest()
+
+
+def estimate_size(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(np.sum(value.memory_usage(deep=True)))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    if hasattr(value, '__dict__'):
+        return sys.getsizeof(value) + estimate_size(vars(value))
+    return sys.getsizeof(value)
+
+
+class AnalyticsCache:
+    # process-wide LRU of derived results (mu, S, frontiers, histories, metrics) keyed on a stage name, the function and
+    # a content hash of its inputs; entries are evicted least-recently-used first once max_mb is exceeded.
+    # cached values are shared between callers and must not be mutated
+    def __init__(self, max_mb=DEFAULT_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = {}
+        self.misses = {}
+        self.lock = threading.Lock()
+
+    def get_or_compute(self, stage, compute, *args, **kwargs):
+        # the function is part of the key, since different functions share a stage (e.g. the two metric functions)
+        function = f"{getattr(compute, '__module__', '')}.{getattr(compute, '__qualname__', repr(compute))}"
+        key = (stage, function, content_hash(args, kwargs))
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits[stage] = self.hits.get(stage, 0) + 1
+                return self.entries[key][0]
+            self.misses[stage] = self.misses.get(stage, 0) + 1
+
+        value = compute(*args, **kwargs)
+        size = estimate_size(value)
+
+        with self.lock:
+            if key not in self.entries and size <= self.max_bytes:
+                self.entries[key] = (value, size)
+                self.total_bytes += size
+                while self.total_bytes > self.max_bytes:
+                    _, (_, evicted_size) = self.entries.popitem(last=False)
+                    self.total_bytes -= evicted_size
+        return value
+
+    def cached(self, stage):
+        def decorator(compute):
+            def wrapper(*args, **kwargs):
+                return self.get_or_compute(stage, compute, *args, **kwargs)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        with self.lock:
+            stages = sorted(set(self.hits) | set(self.misses))
+            entries = {stage: 0 for stage in stages}
+            sizes = {stage: 0 for stage in stages}
+            for (stage, _, _), (_, size) in self.entries.items():
+                entries[stage] += 1
+                sizes[stage] += size
+            return pd.DataFrame({
+                'Hits': [self.hits.get(stage, 0) for stage in stages],
+                'Misses': [self.misses.get(stage, 0) for stage in stages],
+                'Entries': [entries[stage] for stage in stages],
+                'Size (MB)': [sizes[stage] / 1024 / 1024 for stage in stages],
+            }, index=pd.Index(stages, name='Stage'))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+# module state survives Streamlit reruns, so this one instance is shared by every rerun and session
+analytics_cache = AnalyticsCache()
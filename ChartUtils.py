@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+from matplotlib.collections import LineCollection
+
+
+def lttb_indices(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: keep the first and last point, and from each bucket in between the
+    # point that spans the largest triangle with the previous pick and the next bucket's average
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.append(np.floor(np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(int) + 1, n)
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end, next_end = edges[i], edges[i + 1], edges[i + 2]
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+def downsample(series, n_points):
+    # a shape-preserving subset of a date-indexed Series, small enough to draw n_points wide
+    series = series.dropna()
+    if len(series) <= n_points:
+        return series
+    x = series.index.to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(float)
+    return series.iloc[lttb_indices(x, series.to_numpy(dtype=float), n_points)]
+
+
+def plot_downsampled(ax, series, **kwargs):
+    # one point per horizontal pixel of the axes is all a rendered image can show
+    n_points = max(int(ax.get_window_extent().width), 3)
+    data = downsample(series, n_points)
+    # no side padding, like pandas' own date plots
+    ax.margins(x=0)
+    return ax.plot(data.index, data.to_numpy(), **kwargs)
+
+
+def plot_markers(ax, dates, **kwargs):
+    # vertical lines at each date as a single LineCollection, spanning the axes' full height
+    if len(dates) == 0:
+        return None
+    x = np.atleast_1d(ax.convert_xunits(pd.DatetimeIndex(dates).to_pydatetime())).astype(float)
+    segments = np.stack([np.column_stack([x, np.zeros(len(x))]), np.column_stack([x, np.ones(len(x))])], axis=1)
+    markers = LineCollection(segments, transform=ax.get_xaxis_transform(), **kwargs)
+    ax.add_collection(markers, autolim=False)
+    return markers
@@ -0,0 +1,138 @@
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import pandas as pd
+
+logger = logging.getLogger("portfolio_toolkit.diagnostics")
+
+# set to 1 to record (and log) every span even when the app's diagnostics panel is off
+DIAGNOSTICS_ENABLED = os.environ.get("PORTFOLIO_DIAGNOSTICS", "0") == "1"
+# where the JSON span records go; stderr if unset
+DIAGNOSTICS_LOG = os.environ.get("PORTFOLIO_DIAGNOSTICS_LOG")
+
+_active_recorder = ContextVar("diagnostics_recorder", default=None)
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+
+
+def _start_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracing_users += 1
+
+
+def _stop_tracing():
+    global _tracing_users
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def enable_json_logging(path=DIAGNOSTICS_LOG):
+    # one JSON object per line for each span, to a file or stderr; safe to call more than once
+    if logger.handlers:
+        return
+    handler = logging.FileHandler(path) if path else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def input_shapes(values):
+    # shapes of the array-like inputs of a stage, e.g. [[6300, 7]] for a price panel
+    return [list(value.shape) for value in values if hasattr(value, 'shape')]
+
+
+class DiagnosticsRecorder:
+    # collects one record per span: wall time, peak traced allocation above the span's starting point,
+    # and input shapes. tracemalloc is global, so memory figures include other threads running meanwhile
+    def __init__(self, trace_memory=True):
+        self.records = []
+        self.trace_memory = trace_memory
+        self.stack = []
+        if trace_memory:
+            _start_tracing()
+
+    def close(self):
+        if self.trace_memory:
+            self.trace_memory = False
+            _stop_tracing()
+
+    def enter(self):
+        frame = {'time': time.time(), 'start': time.perf_counter(), 'depth': len(self.stack), 'base': 0, 'peak': 0}
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.stack:
+                self.stack[-1]['peak'] = max(self.stack[-1]['peak'], peak)
+            frame['base'] = frame['peak'] = current
+            tracemalloc.reset_peak()
+        self.stack.append(frame)
+        return frame
+
+    def exit(self, frame, stage, inputs, details, error):
+        self.stack.pop()
+        record = {'time': frame['time'], 'stage': stage, 'wall_time_s': time.perf_counter() - frame['start'], 'depth': frame['depth']}
+        if self.trace_memory:
+            # a nested span resets the peak counter, so the highest peak seen inside it is carried up
+            frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            record['peak_memory_mb'] = (frame['peak'] - frame['base']) / 1024 / 1024
+            if self.stack:
+                self.stack[-1]['peak'] = max(self.stack[-1]['peak'], frame['peak'])
+        record['input_shapes'] = input_shapes(inputs)
+        record.update(details)
+        if error is not None:
+            record['error'] = type(error).__name__
+        self.records.append(record)
+        logger.info(json.dumps(record))
+
+    def table(self):
+        # spans close innermost first, so records are put back in start order and indented by depth
+        table = pd.DataFrame(self.records).sort_values('time', kind='stable') if self.records else pd.DataFrame(columns=['stage', 'depth', 'time'])
+        table['stage'] = ['  ' * depth + stage for stage, depth in zip(table['stage'], table['depth'])]
+        return table.drop(columns=['depth', 'time']).reset_index(drop=True)
+
+
+def begin_diagnostics(enabled=DIAGNOSTICS_ENABLED, trace_memory=True):
+    # makes a fresh recorder current for this thread/context (or none, if disabled) and retires the previous one
+    previous = _active_recorder.get()
+    if previous is not None:
+        previous.close()
+    recorder = DiagnosticsRecorder(trace_memory) if enabled else None
+    _active_recorder.set(recorder)
+    return recorder
+
+
+def end_diagnostics(recorder):
+    if recorder is not None:
+        recorder.close()
+        if _active_recorder.get() is recorder:
+            _active_recorder.set(None)
+
+
+@contextmanager
+def span(stage, *inputs, **details):
+    # times a stage when a recorder is active; otherwise costs one context-variable lookup.
+    # inputs are recorded by shape, details (e.g. tickers=7) as they are
+    recorder = _active_recorder.get()
+    if recorder is None:
+        yield
+        return
+    frame = recorder.enter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        recorder.exit(frame, stage, inputs, details, error)
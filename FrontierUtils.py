@@ -0,0 +1,191 @@
+import os
+from collections import OrderedDict
+
+import cvxpy as cp
+import numpy as np
+import pandas as pd
+
+from DiagnosticsUtils import span
+from JobUtils import map_chunks, report_progress
+from RiskModels import FactorCovariance
+
+RISK_FREE_RATE = 0.02
+# interior-point Clarabel converges in ~10 iterations on Ledoit-Wolf matrices where OSQP needs thousands,
+# so it wins even without a primal warm start; the compiled parametric program is what gets reused
+FRONTIER_SOLVER = cp.CLARABEL if cp.CLARABEL in cp.installed_solvers() else cp.OSQP
+
+
+def _as_risk_model(S):
+    # a FactorCovariance is kept in factor form; anything else is a dense covariance matrix
+    return S if isinstance(S, FactorCovariance) else np.asarray(S, dtype=float)
+
+
+def _risk_expression(weights, S):
+    if isinstance(S, FactorCovariance):
+        return S.risk_expression(weights)
+    return cp.quad_form(weights, cp.psd_wrap(S))
+
+
+def portfolio_variances(weights, S):
+    if isinstance(S, FactorCovariance):
+        return S.portfolio_variance(weights)
+    weights = np.asarray(weights, dtype=float)
+    return np.einsum('...j,jk,...k->...', weights, S, weights)
+
+
+class FrontierProblem:
+    # one parametrised QP (min variance [+ L2] s.t. return >= target) reused for every point on the
+    # frontier; only the target changes, so cvxpy canonicalises once and each solve warm-starts from the last
+    def __init__(self, mu, S, l2_gamma=None, weight_bounds=(0, 1)):
+        mu = np.asarray(mu, dtype=float)
+        self.weights = cp.Variable(len(mu))
+        self.target = cp.Parameter()
+        objective = _risk_expression(self.weights, _as_risk_model(S))
+        if l2_gamma:
+            objective = objective + l2_gamma * cp.sum_squares(self.weights)
+        constraints = [
+            cp.sum(self.weights) == 1,
+            self.weights >= weight_bounds[0],
+            self.weights <= weight_bounds[1],
+            mu @ self.weights >= self.target,
+        ]
+        self.problem = cp.Problem(cp.Minimize(objective), constraints)
+
+    def solve(self, target):
+        self.target.value = target
+        # a solve that raises leaves the previous target's status and weights in place, so it counts as failed
+        try:
+            self.problem.solve(solver=FRONTIER_SOLVER, warm_start=True)
+            solved = self.problem.status in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE)
+        except cp.SolverError:
+            solved = False
+        if not solved:
+            try:
+                self.problem.solve()
+            except cp.SolverError as error:
+                raise ValueError(f"could not solve for a target return of {target:.4f}") from error
+            if self.problem.status not in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE) or self.weights.value is None:
+                raise ValueError(f"could not solve for a target return of {target:.4f}")
+        return np.asarray(self.weights.value)
+
+
+def _solve_targets(mu, S, l2_gamma, weight_bounds, targets):
+    # a worker's contiguous run of frontier points, solved in order so neighbours warm-start each other
+    problem = FrontierProblem(mu, S, l2_gamma, weight_bounds)
+    return np.array([problem.solve(target) for target in targets])
+
+
+def _frontier_points(weights, mu, S):
+    returns = weights @ mu
+    return returns, np.sqrt(np.maximum(portfolio_variances(weights, S), 0.0))
+
+
+def _sharpe_scores(weights, mu, S, l2_gamma, risk_free_rate):
+    # what max-Sharpe maximises along the frontier. With L2 on, the penalty counts as risk: the ratio of excess
+    # return to sqrt(variance + gamma * |w|^2) peaks where pypfopt's regularised max_sharpe does
+    weights = np.atleast_2d(weights)
+    returns, volatilities = _frontier_points(weights, mu, S)
+    risk = volatilities ** 2 + (l2_gamma or 0.0) * np.sum(weights ** 2, axis=1)
+    return (returns - risk_free_rate) / np.sqrt(risk)
+
+
+def portfolio_performance(weights, mu, S, risk_free_rate=RISK_FREE_RATE):
+    weights = np.asarray(weights, dtype=float)
+    ret = float(weights @ np.asarray(mu, dtype=float))
+    vol = float(np.sqrt(max(portfolio_variances(weights, _as_risk_model(S)), 0.0)))
+    return ret, vol, (ret - risk_free_rate) / vol
+
+
+def clean_weights(weights, tickers, cutoff=1e-4, rounding=5):
+    # same clean-up as EfficientFrontier.clean_weights
+    weights = np.where(np.abs(weights) < cutoff, 0.0, weights)
+    weights = np.round(weights, rounding)
+    return OrderedDict(zip(tickers, weights.tolist()))
+
+
+def _max_return(mu, weight_bounds):
+    # the box-and-budget LP is solved greedily: lower bounds everywhere, the rest to the best assets first
+    low, high = weight_bounds
+    weights = np.full(len(mu), float(low))
+    remaining = 1 - weights.sum()
+    for i in np.argsort(mu)[::-1]:
+        weights[i] += min(high - low, remaining)
+        remaining -= weights[i] - low
+    return float(weights @ mu)
+
+
+def _refine_max_sharpe(problem, low, high, mu, S, l2_gamma, risk_free_rate, iterations=10):
+    golden = (np.sqrt(5) - 1) / 2
+    sharpe_at = lambda target: _sharpe_scores(problem.solve(target), mu, S, l2_gamma, risk_free_rate)[0]
+    left, right = high - golden * (high - low), low + golden * (high - low)
+    sharpe_left, sharpe_right = sharpe_at(left), sharpe_at(right)
+    for _ in range(iterations):
+        if sharpe_left >= sharpe_right:
+            high, right, sharpe_right = right, left, sharpe_left
+            left = high - golden * (high - low)
+            sharpe_left = sharpe_at(left)
+        else:
+            low, left, sharpe_left = left, right, sharpe_right
+            right = low + golden * (high - low)
+            sharpe_right = sharpe_at(right)
+    return problem.solve((low + high) / 2)
+
+
+def compute_efficient_frontier(mu, S, l2_gamma=None, weight_bounds=(0, 1), points=100, risk_free_rate=RISK_FREE_RATE, n_jobs=1):
+    # the whole frontier as one parametric sweep; max-Sharpe and min-volatility come from the same sweep
+    tickers = list(mu.index) if hasattr(mu, 'index') else list(range(len(mu)))
+    mu_values = np.asarray(mu, dtype=float)
+    S_values = _as_risk_model(S)
+
+    # the return constraint is slack at the lowest asset return, which gives the min-volatility portfolio
+    report_progress('Solving the minimum-volatility portfolio')
+    with span('min_volatility_solve', mu_values):
+        problem = FrontierProblem(mu_values, S_values, l2_gamma, weight_bounds)
+        weights_min_vol = problem.solve(mu_values.min())
+    min_return = float(weights_min_vol @ mu_values)
+    max_return = _max_return(mu_values, weight_bounds)
+    targets = np.linspace(min_return, max_return - 0.0001, points)
+
+    # each solved point is reported with the curve so far, so a page can draw the frontier as it fills in
+    solved_returns, solved_volatilities = [], []
+    def report_points(_, weights):
+        returns, volatilities = _frontier_points(np.atleast_2d(weights), mu_values, S_values)
+        solved_returns.extend(returns)
+        solved_volatilities.extend(volatilities)
+        report_progress('Solving the efficient frontier', len(solved_returns) / points,
+                        frontier=pd.DataFrame({'Volatility': solved_volatilities, 'Return': solved_returns}))
+
+    with span('frontier_sweep', targets):
+        if n_jobs > 1:
+            runs = [run for run in np.array_split(targets, n_jobs) if len(run)]
+            frontier_weights = np.vstack(map_chunks(_solve_targets, [(mu_values, S_values, l2_gamma, weight_bounds, run) for run in runs],
+                                                    len(runs), report_points))
+        else:
+            frontier_weights = np.array(map_chunks(problem.solve, [(target,) for target in targets], on_result=report_points))
+
+    returns, volatilities = _frontier_points(frontier_weights, mu_values, S_values)
+    sharpe_ratios = (returns - risk_free_rate) / volatilities
+    scores = _sharpe_scores(frontier_weights, mu_values, S_values, l2_gamma, risk_free_rate)
+
+    # refine the best sweep point with a golden-section search between its neighbours
+    best = int(np.argmax(scores))
+    report_progress('Refining the maximum-Sharpe portfolio', 1.0)
+    with span('max_sharpe_solve', mu_values):
+        weights_sharpe = _refine_max_sharpe(problem, targets[max(best - 1, 0)], targets[min(best + 1, len(targets) - 1)],
+                                            mu_values, S_values, l2_gamma, risk_free_rate)
+    if _sharpe_scores(weights_sharpe, mu_values, S_values, l2_gamma, risk_free_rate)[0] < scores[best]:
+        weights_sharpe = frontier_weights[best]
+
+    frontier = pd.DataFrame(frontier_weights, columns=tickers)
+    frontier.insert(0, 'Sharpe Ratio', sharpe_ratios)
+    frontier.insert(0, 'Volatility', volatilities)
+    frontier.insert(0, 'Return', returns)
+
+    max_sharpe = (clean_weights(weights_sharpe, tickers), portfolio_performance(weights_sharpe, mu_values, S_values, risk_free_rate))
+    min_vol = (clean_weights(weights_min_vol, tickers), portfolio_performance(weights_min_vol, mu_values, S_values, risk_free_rate))
+    return frontier, max_sharpe, min_vol
+
+
+def default_frontier_jobs(n_assets):
+    # worker start-up only pays off once each solve is expensive
+    return min(os.cpu_count() or 1, 8) if n_assets >= 50 else 1
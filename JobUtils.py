@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+
+# how many optimizations/simulations run at once, shared by every session of the app; more are queued
+JOB_WORKERS = int(os.environ.get("PORTFOLIO_JOB_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="portfolio-job")
+_current_job = ContextVar("current_job", default=None)
+# map_chunks is called from the job threads above; forking a multi-threaded process can copy a lock some other
+# thread holds into the child, which then deadlocks, so worker processes start from a fresh interpreter
+_process_context = multiprocessing.get_context('spawn')
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    # one background computation. The worker writes its stage, progress and partial results, the page
+    # polls them; cancelling only sets a flag, which the work notices at its next report_progress()
+    def __init__(self, key):
+        self.key = key
+        self.lock = threading.Lock()
+        self.stage = 'Queued'
+        self.fraction = 0.0
+        self.partial = {}
+        # bumped on every report, so a poller only redraws when something changed
+        self.version = 0
+        self.cancelled = threading.Event()
+        self.future = None
+
+    def report(self, stage, fraction, partial):
+        with self.lock:
+            self.stage = stage
+            self.fraction = fraction
+            self.partial.update(partial)
+            self.version += 1
+
+    def progress(self):
+        with self.lock:
+            return self.stage, self.fraction, dict(self.partial), self.version
+
+    def cancel(self):
+        self.cancelled.set()
+        # a job still waiting for a worker never starts
+        self.future.cancel()
+
+    def done(self):
+        return self.future.done()
+
+    def result(self):
+        # the job's return value, or its exception re-raised in the caller
+        return self.future.result()
+
+
+def _run(job, compute, args, kwargs):
+    _current_job.set(job)
+    check_cancelled()
+    return compute(*args, **kwargs)
+
+
+def submit_job(key, compute, *args, **kwargs):
+    # compute(*args, **kwargs) on the shared pool, in a copy of the caller's context so diagnostics
+    # spans opened by the job land in the caller's recorder. key identifies the inputs the job was run for
+    job = Job(key)
+    job.future = _executor.submit(copy_context().run, _run, job, compute, args, kwargs)
+    return job
+
+
+def check_cancelled():
+    job = _current_job.get()
+    if job is not None and job.cancelled.is_set():
+        raise JobCancelled(job.stage)
+
+
+def report_progress(stage, fraction=0.0, **partial):
+    # a no-op outside a job; inside one it is also where a cancelled job stops
+    job = _current_job.get()
+    if job is not None:
+        check_cancelled()
+        job.report(stage, fraction, partial)
+
+
+def map_chunks(function, jobs, n_jobs=1, on_result=None):
+    # function(*job) for every job, in a process pool when n_jobs > 1, calling on_result(done, result)
+    # in job order as results arrive. If on_result raises (e.g. JobCancelled), chunks not yet started are dropped
+    results = []
+    if n_jobs > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(jobs)), mp_context=_process_context) as pool:
+            try:
+                for result in pool.map(function, *zip(*jobs)):
+                    results.append(result)
+                    if on_result is not None:
+                        on_result(len(results), result)
+            except BaseException:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+    else:
+        for job in jobs:
+            results.append(function(*job))
+            if on_result is not None:
+                on_result(len(results), results[-1])
+    return results
@@ -0,0 +1,202 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+TRADING_DAYS_PER_YEAR = 252
+# rolling drawdowns look at every window explicitly, in blocks of at most this many values
+ROLLING_BLOCK_ELEMENTS = 4_000_000
+
+
+def bars_per_year(index, default=TRADING_DAYS_PER_YEAR):
+    # annualisation factor of a DatetimeIndex of bars: 252 for weekday daily bars (365 if weekends trade),
+    # ~52 weekly, ~12 monthly, and bars per session x sessions per year for intraday bars, so nights,
+    # weekends and holidays are not counted as periods. default when the index has no timestamps
+    if not isinstance(index, pd.DatetimeIndex) or len(index) < 3:
+        return default
+    spacing = (index[1:] - index[:-1]).median() / pd.Timedelta(days=1)
+    sessions_per_year = 365 if (index.dayofweek >= 5).any() else TRADING_DAYS_PER_YEAR
+    if spacing < 1:
+        # the median session, so half days and sessions cut off at either end of the index do not skew it
+        return float(index.normalize().value_counts().median()) * sessions_per_year
+    if spacing < 4:
+        return sessions_per_year
+    return 365.25 / spacing
+
+
+def _as_matrix(curves):
+    # (periods, series) values plus column names and index from a Series, DataFrame or array
+    if isinstance(curves, pd.Series):
+        curves = curves.to_frame()
+    if isinstance(curves, pd.DataFrame):
+        return curves.to_numpy(dtype=float), list(curves.columns), curves.index
+    values = np.asarray(curves, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    return values, list(range(values.shape[1])), None
+
+
+def _benchmark_returns(benchmark, index):
+    if isinstance(benchmark, pd.Series) and index is not None:
+        benchmark = benchmark.reindex(index)
+    benchmark = np.asarray(benchmark, dtype=float).reshape(-1, 1)
+    return benchmark[1:] / benchmark[:-1] - 1
+
+
+def _drawdown_stats(values, axis=0):
+    # deepest drop from the running peak, and the longest stretch (in periods) spent below it
+    values = np.moveaxis(values, axis, 0)
+    peaks = np.maximum.accumulate(values, axis=0)
+    rows = np.arange(len(values)).reshape((-1,) + (1,) * (values.ndim - 1))
+    last_peak = np.maximum.accumulate(np.where(values >= peaks, rows, 0), axis=0)
+    return (values / peaks - 1).min(axis=0), (rows - last_peak).max(axis=0)
+
+
+def _window_sums(x, window):
+    cumulative = np.concatenate([np.zeros((1,) + x.shape[1:]), np.cumsum(x, axis=0)])
+    return cumulative[window:] - cumulative[:-window]
+
+
+def _summarise(growth, count, sums, periods_per_year, risk_free_rate, drawdown, duration):
+    # every metric from per-series sums, so one code path serves the full period and every rolling window
+    mean = sums['r'] / count
+    variance = np.maximum((sums['r2'] - sums['r'] * mean) / (count - 1), 0.0)
+    annual_return = mean * periods_per_year
+    volatility = np.sqrt(variance * periods_per_year)
+    downside = np.sqrt(sums['down2'] / count * periods_per_year)
+    cagr = growth ** (periods_per_year / count) - 1
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        metrics = {
+            'CAGR': cagr,
+            'Annual Return': annual_return,
+            'Annual Volatility': volatility,
+            'Sharpe Ratio': (annual_return - risk_free_rate) / volatility,
+            'Sortino Ratio': (annual_return - risk_free_rate) / downside,
+            'Max Drawdown': drawdown,
+            'Max Drawdown Duration': duration,
+            'Calmar Ratio': cagr / -drawdown,
+        }
+        if 'b' in sums:
+            benchmark_mean = sums['b'] / count
+            benchmark_variance = (sums['b2'] - sums['b'] * benchmark_mean) / (count - 1)
+            covariance = (sums['rb'] - sums['r'] * benchmark_mean) / (count - 1)
+            metrics['Beta'] = covariance / benchmark_variance
+            metrics['Tracking Error'] = np.sqrt(np.maximum(variance + benchmark_variance - 2 * covariance, 0.0) * periods_per_year)
+    return metrics
+
+
+def _return_terms(returns, benchmark_returns):
+    terms = {'r': returns, 'r2': returns ** 2, 'down2': np.minimum(returns, 0.0) ** 2}
+    if benchmark_returns is not None:
+        terms.update(b=benchmark_returns, b2=benchmark_returns ** 2, rb=returns * benchmark_returns)
+    return terms
+
+
+class MetricAccumulator:
+    # running sums and drawdown state for a set of equity curves, so metrics can be extended with new
+    # periods in O(new periods) instead of rescanning the history. to_dict()/from_dict() round-trip
+    # through JSON, which is how simulation checkpoints store it
+    def __init__(self, names, with_benchmark=False):
+        self.names = list(names)
+        n = len(self.names)
+        keys = ['r', 'r2', 'down2'] + (['b', 'b2', 'rb'] if with_benchmark else [])
+        self.sums = {key: np.zeros(1 if key in ('b', 'b2') else n) for key in keys}
+        self.count = 0
+        self.first = None
+        self.last = None
+        self.last_benchmark = None
+        self.peak = np.full(n, -np.inf)
+        self.peak_row = np.zeros(n)
+        self.max_drawdown = np.zeros(n)
+        self.max_duration = np.zeros(n)
+
+    def update(self, values, benchmark=None):
+        if len(values) == 0:
+            return self
+        values = np.asarray(values, dtype=float).reshape(len(values), -1)
+        # the first new return is measured from the last value already seen
+        previous = values if self.last is None else np.vstack([self.last, values])
+        returns = previous[1:] / previous[:-1] - 1
+        benchmark_returns = None
+        if 'b' in self.sums:
+            benchmark = np.asarray(benchmark, dtype=float).reshape(-1, 1)
+            previous_benchmark = benchmark if self.last_benchmark is None else np.vstack([[self.last_benchmark], benchmark])
+            benchmark_returns = previous_benchmark[1:] / previous_benchmark[:-1] - 1
+            self.last_benchmark = float(benchmark[-1, 0])
+        for key, term in _return_terms(returns, benchmark_returns).items():
+            self.sums[key] = self.sums[key] + term.sum(axis=0)
+
+        # drawdowns continue from the stored peak and the row it was set on
+        rows = self.count + (self.last is not None) + np.arange(len(values))[:, None]
+        peaks = np.maximum.accumulate(np.vstack([self.peak, values]), axis=0)[1:]
+        last_peak = np.maximum.accumulate(np.vstack([self.peak_row, np.where(values >= peaks, rows, 0)]), axis=0)[1:]
+        self.max_drawdown = np.minimum(self.max_drawdown, (values / peaks - 1).min(axis=0))
+        self.max_duration = np.maximum(self.max_duration, (rows - last_peak).max(axis=0))
+        self.peak, self.peak_row = peaks[-1], last_peak[-1]
+
+        self.count += len(returns)
+        self.first = values[0] if self.first is None else self.first
+        self.last = values[-1]
+        return self
+
+    def metrics(self, periods_per_year=TRADING_DAYS_PER_YEAR, risk_free_rate=0.0):
+        metrics = _summarise(self.last / self.first, self.count, self.sums, periods_per_year, risk_free_rate,
+                             self.max_drawdown, self.max_duration)
+        return pd.DataFrame(metrics, index=self.names)
+
+    def to_dict(self):
+        arrays = {key: getattr(self, key) for key in ('first', 'last', 'peak', 'peak_row', 'max_drawdown', 'max_duration')}
+        return {
+            'names': self.names,
+            'count': self.count,
+            'last_benchmark': self.last_benchmark,
+            'sums': {key: value.tolist() for key, value in self.sums.items()},
+            **{key: None if value is None else value.tolist() for key, value in arrays.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        accumulator = cls(state['names'], with_benchmark='b' in state['sums'])
+        accumulator.count = state['count']
+        accumulator.last_benchmark = state['last_benchmark']
+        accumulator.sums = {key: np.asarray(value, dtype=float) for key, value in state['sums'].items()}
+        for key in ('first', 'last', 'peak', 'peak_row', 'max_drawdown', 'max_duration'):
+            setattr(accumulator, key, None if state[key] is None else np.asarray(state[key], dtype=float))
+        return accumulator
+
+
+def performance_metrics(curves, benchmark=None, periods_per_year=None, risk_free_rate=0.0):
+    # one row of metrics per equity curve (column), all columns in one vectorised pass over the periods;
+    # annualised by bars_per_year() of the curves' index unless periods_per_year is given
+    values, names, index = _as_matrix(curves)
+    periods_per_year = periods_per_year or bars_per_year(index)
+    if benchmark is not None and isinstance(benchmark, pd.Series) and index is not None:
+        benchmark = benchmark.reindex(index)
+    accumulator = MetricAccumulator(names, with_benchmark=benchmark is not None)
+    return accumulator.update(values, benchmark).metrics(periods_per_year, risk_free_rate)
+
+
+def rolling_metrics(curves, window=None, benchmark=None, periods_per_year=None, risk_free_rate=0.0):
+    # the same metrics over every trailing window of `window` returns (default: one year of bars), as
+    # (metric, series) columns. Moment-based metrics come from differences of cumulative sums, O(T) per series;
+    # drawdowns have to look inside each window, so they cost O(T * window) and are done in bounded blocks
+    values, names, index = _as_matrix(curves)
+    periods_per_year = periods_per_year or bars_per_year(index)
+    window = window or int(round(periods_per_year))
+    returns = values[1:] / values[:-1] - 1
+    if len(returns) < window:
+        raise ValueError(f"rolling metrics need at least {window} periods of returns")
+    benchmark_returns = None if benchmark is None else _benchmark_returns(benchmark, index)
+    sums = {key: _window_sums(term, window) for key, term in _return_terms(returns, benchmark_returns).items()}
+
+    windows = sliding_window_view(values, window + 1, axis=0)
+    drawdown = np.empty(windows.shape[:2])
+    duration = np.empty(windows.shape[:2])
+    block = max(1, ROLLING_BLOCK_ELEMENTS // (values.shape[1] * (window + 1)))
+    for start in range(0, len(windows), block):
+        drawdown[start:start + block], duration[start:start + block] = _drawdown_stats(windows[start:start + block], axis=-1)
+
+    metrics = _summarise(values[window:] / values[:-window], window, sums, periods_per_year, risk_free_rate, drawdown, duration)
+    padding = np.full((window, len(names)), np.nan)
+    columns = pd.MultiIndex.from_product([list(metrics), names])
+    return pd.DataFrame(np.hstack([np.vstack([padding, metric]) for metric in metrics.values()]), index=index, columns=columns)
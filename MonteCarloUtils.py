@@ -0,0 +1,168 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from JobUtils import map_chunks, report_progress
+from PortfolioUtils import REBALANCE_PERIOD_MONTHS
+
+TRADING_DAYS_PER_MONTH = 21
+# simulated paths are processed this many days at a time so memory is (paths x step x assets)
+DAYS_PER_STEP = 63
+# log-wealth histograms accumulate the percentile bands without keeping paths. Each band day's range is the
+# assets' mean log growth +- this many standard deviations, doubled (at most LOG_WEALTH_WIDENINGS times) while
+# any path lands outside it
+LOG_WEALTH_SIGMAS = 8.0
+LOG_WEALTH_WIDENINGS = 3
+LOG_WEALTH_BINS = 4000
+DRAWDOWN_BINS = 1000
+
+
+class BlockBootstrapSampler:
+    # resamples contiguous blocks of historical daily returns, keeping short-range autocorrelation
+    # and the cross-asset correlation of each day
+    def __init__(self, gross_returns, block_length=TRADING_DAYS_PER_MONTH):
+        self.gross_returns = np.asarray(gross_returns, dtype=float)
+        self.block_length = max(1, min(block_length, len(self.gross_returns)))
+
+    def log_return_moments(self):
+        # mean and standard deviation of each asset's daily log return
+        log_returns = np.log(self.gross_returns)
+        return log_returns.mean(axis=0), log_returns.std(axis=0)
+
+    def sample(self, rng, n_paths, n_days):
+        n_blocks = -(-n_days // self.block_length)
+        starts = rng.integers(0, len(self.gross_returns) - self.block_length + 1, (n_paths, n_blocks))
+        rows = (starts[:, :, None] + np.arange(self.block_length)).reshape(n_paths, -1)[:, :n_days]
+        return self.gross_returns[rows]
+
+
+class GaussianSampler:
+    # log-normal daily returns from annual expected returns and covariance (e.g. the Ledoit-Wolf mu and S);
+    # the drift is chosen so each asset compounds at mu per year
+    def __init__(self, mu, S, periods_per_year=252):
+        mu = np.asarray(mu, dtype=float)
+        self.mean = np.log1p(mu) / periods_per_year
+        self.cholesky = np.linalg.cholesky(np.asarray(S, dtype=float) / periods_per_year + 1e-12 * np.eye(len(mu)))
+
+    def log_return_moments(self):
+        return self.mean, np.sqrt(np.sum(self.cholesky ** 2, axis=1))
+
+    def sample(self, rng, n_paths, n_days):
+        shocks = rng.standard_normal((n_paths, n_days, len(self.mean)))
+        return np.exp(self.mean + shocks @ self.cholesky.T)
+
+
+def _bin_index(values, low, high, n_bins):
+    # values outside [low, high] land in the end bins; callers count them separately
+    index = np.floor((values - low) / (high - low) * n_bins)
+    return np.clip(index, 0, n_bins - 1).astype(int)
+
+
+def log_wealth_ranges(sampler, band_days, sigmas=LOG_WEALTH_SIGMAS):
+    # (low, high) log wealth per band day: every portfolio return is a weighted average of the assets' returns,
+    # so its log growth stays near the assets' mean growth mean*d, give or take a few sigma*sqrt(d)
+    mean, std = sampler.log_return_moments()
+    spread = sigmas * max(float(np.max(std)), 1e-4) * np.sqrt(band_days)
+    return np.min(mean) * band_days - spread, np.max(mean) * band_days + spread
+
+
+def _simulate_chunk(sampler, weights, rebalance_days, horizon_days, band_days, lows, highs, n_paths, seed):
+    # simulate one chunk of paths and return histograms only, so nothing grows with the path count.
+    # overflow counts, per band day, the paths whose log wealth fell outside that day's range
+    rng = np.random.default_rng(seed)
+    band_counts = np.zeros((len(band_days), LOG_WEALTH_BINS), dtype=np.int64)
+    overflow = np.zeros(len(band_days), dtype=np.int64)
+
+    asset_balances = np.tile(weights, (n_paths, 1))
+    peak = np.ones(n_paths)
+    max_drawdown = np.zeros(n_paths)
+    day = 0
+    while day < horizon_days:
+        # never step across a rebalance date
+        next_rebalance = (day // rebalance_days + 1) * rebalance_days if np.isfinite(rebalance_days) else np.inf
+        step = int(min(DAYS_PER_STEP, horizon_days - day, next_rebalance - day))
+
+        asset_paths = asset_balances[:, None, :] * np.cumprod(sampler.sample(rng, n_paths, step), axis=1)
+        wealth = asset_paths.sum(axis=2)
+        asset_balances = asset_paths[:, -1, :]
+
+        running_peak = np.maximum(np.maximum.accumulate(wealth, axis=1), peak[:, None])
+        max_drawdown = np.maximum(max_drawdown, (1 - wealth / running_peak).max(axis=1))
+        peak = running_peak[:, -1]
+
+        in_step = np.flatnonzero((band_days > day) & (band_days <= day + step))
+        if len(in_step):
+            columns = band_days[in_step] - day - 1
+            log_wealth = np.log(wealth[:, columns])
+            overflow[in_step] += np.sum((log_wealth < lows[in_step]) | (log_wealth > highs[in_step]), axis=0)
+            bins = _bin_index(log_wealth, lows[in_step], highs[in_step], LOG_WEALTH_BINS)
+            flat = (in_step[None, :] * LOG_WEALTH_BINS + bins).ravel()
+            band_counts += np.bincount(flat, minlength=band_counts.size).reshape(band_counts.shape)
+
+        day += step
+        if day == next_rebalance:
+            asset_balances = weights * wealth[:, -1:]
+
+    drawdown_counts = np.bincount(_bin_index(max_drawdown, 0.0, 1.0, DRAWDOWN_BINS), minlength=DRAWDOWN_BINS)
+    return band_counts, drawdown_counts, overflow
+
+
+def _histogram_percentiles(counts, low, width, percentiles):
+    # percentiles of binned data, interpolating linearly inside the bin that crosses each level;
+    # low and width are the first bin edge and bin width of each histogram (row)
+    cdf = np.cumsum(counts, axis=-1) / counts.sum(axis=-1, keepdims=True)
+    result = []
+    for q in np.asarray(percentiles) / 100:
+        position = np.argmax(cdf >= q, axis=-1)[..., None]
+        upper = np.take_along_axis(cdf, position, -1)[..., 0]
+        lower = np.where(position[..., 0] > 0, np.take_along_axis(cdf, np.maximum(position - 1, 0), -1)[..., 0], 0.0)
+        fraction = (q - lower) / np.maximum(upper - lower, 1e-12)
+        result.append(low + (position[..., 0] + fraction) * width)
+    return np.stack(result, axis=-1)
+
+
+def project_portfolio(sampler,
+                      initial_balance,
+                      asset_weights,
+                      rebalance_period,
+                      horizon_days=252 * 10,
+                      n_paths=100_000,
+                      percentiles=(5, 25, 50, 75, 95),
+                      chunk_size=2_000,
+                      n_points=120,
+                      n_jobs=None,
+                      seed=0):
+    weights = np.asarray(asset_weights, dtype=float)
+    rebalance_days = REBALANCE_PERIOD_MONTHS[rebalance_period] * TRADING_DAYS_PER_MONTH
+    band_days = np.unique(np.linspace(0, horizon_days, n_points + 1).round().astype(int)[1:])
+
+    chunk_paths = [min(chunk_size, n_paths - start) for start in range(0, n_paths, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_paths))
+    n_jobs = n_jobs or os.cpu_count() or 1
+
+    sigmas = LOG_WEALTH_SIGMAS
+    for widening in range(LOG_WEALTH_WIDENINGS + 1):
+        lows, highs = log_wealth_ranges(sampler, band_days, sigmas)
+        jobs = [(sampler, weights, rebalance_days, horizon_days, band_days, lows, highs, paths, chunk_seed)
+                for paths, chunk_seed in zip(chunk_paths, seeds)]
+        results = map_chunks(_simulate_chunk, jobs, n_jobs, lambda done, _: report_progress('Simulating paths', done / len(jobs)))
+        overflow = sum(overflow for _, _, overflow in results)
+        if not overflow.any():
+            break
+        # the same seeds again, binned over a wider range
+        sigmas *= 2
+    else:
+        raise ValueError(f"{overflow.sum()} projected balances fell outside the histogram range even at {sigmas / 2:g} standard deviations")
+    band_counts = sum(counts for counts, _, _ in results)
+    drawdown_counts = sum(counts for _, counts, _ in results)
+
+    widths = (highs - lows) / LOG_WEALTH_BINS
+    band_values = initial_balance * np.exp(_histogram_percentiles(band_counts, lows, widths, percentiles))
+    bands = pd.DataFrame(band_values, index=pd.Index(band_days, name='Trading Day'), columns=[f"P{q}" for q in percentiles])
+    bands.loc[0] = initial_balance
+    bands = bands.sort_index()
+
+    summary = pd.DataFrame([bands.iloc[-1].to_numpy(), _histogram_percentiles(drawdown_counts, 0.0, 1 / DRAWDOWN_BINS, percentiles)],
+                           index=['Terminal Balance', 'Max Drawdown'], columns=bands.columns)
+    return bands, summary
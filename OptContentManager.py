@@ -42,6 +42,9 @@ class OptContent:
 
         **📊 Analyze Performances:**
         - View the historically backtested performance of these portfolios over your selected period to see potential long-term growth.
+
+        **🎲 Resampled Weights:**
+        - Optimal weights are very sensitive to noise in the estimated returns, which is why results often put 0% in assets like SPY and most of the portfolio in a few others. Resampling redraws the history thousands of times, optimizes each draw, and averages the weights, giving steadier and more diversified allocations.
         """
 
 
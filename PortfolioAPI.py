@@ -0,0 +1,226 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+from pypfopt import risk_models, expected_returns
+
+from CacheUtils import analytics_cache
+from DiagnosticsUtils import span
+from FrontierUtils import clean_weights, compute_efficient_frontier, default_frontier_jobs, portfolio_performance
+from JobUtils import report_progress
+from MetricsUtils import bars_per_year, performance_metrics
+from PortfolioUtils import (STREAM_CHUNK_ROWS, SimulationState, load_adj_close, load_price_panel, start_simulation, extend_simulation,
+                            stream_simulation, simulate_policy, calculate_cumulative_returns, calculate_metrics)
+from ResamplingUtils import resample_portfolios
+from RiskModels import FactorCovariance
+
+# the Optimizer and Simulator pipelines without any rendering, shared by app.py and run_batch.py
+
+
+@dataclass
+class ResampledResult:
+    # bootstrap-averaged portfolios, scored on the full-sample mu and S, plus the weights of every sample
+    weights_sharpe: dict
+    performance_sharpe: tuple
+    weights_min_vol: dict
+    performance_min_vol: tuple
+    samples_sharpe: pd.DataFrame
+    samples_min_vol: pd.DataFrame
+
+
+@dataclass
+class OptimizationResult:
+    data: pd.DataFrame
+    benchmark_data: pd.Series
+    mu: pd.Series
+    S: object  # DataFrame (Ledoit-Wolf) or FactorCovariance
+    frontier: pd.DataFrame
+    weights_sharpe: dict
+    performance_sharpe: tuple
+    weights_min_vol: dict
+    performance_min_vol: tuple
+    benchmark_performance: tuple
+    cumulative_returns_sharpe: pd.Series
+    cumulative_returns_min_vol: pd.Series
+    cumulative_returns_benchmark: pd.Series
+    metrics: pd.DataFrame = None
+    resampled: ResampledResult = None
+
+
+@dataclass
+class SimulationResult:
+    portfolio_history: pd.Series
+    benchmark_history: pd.Series
+    rebalance_dates: list = field(default_factory=list)
+    portfolio_metrics: tuple = ()
+    benchmark_metrics: tuple = ()
+    metrics: pd.DataFrame = None
+    state: SimulationState = None
+    trading_costs: pd.Series = None
+
+
+def _stage(cache, stage, compute, *args, **kwargs):
+    with span(stage, *args):
+        if cache is None:
+            return compute(*args, **kwargs)
+        return cache.get_or_compute(stage, compute, *args, **kwargs)
+
+
+def ledoit_wolf_covariance(data, frequency=252):
+    return risk_models.CovarianceShrinkage(data, frequency=frequency).ledoit_wolf()
+
+
+def factor_covariance(data, n_factors=30, frequency=252):
+    return FactorCovariance.from_prices(data, n_factors, frequency)
+
+
+def estimate_covariance(data, risk_model='ledoit_wolf', n_factors=30, frequency=252):
+    if risk_model == 'ledoit_wolf':
+        return ledoit_wolf_covariance(data, frequency)
+    if risk_model == 'factor':
+        return factor_covariance(data, n_factors, frequency)
+    raise ValueError(f"unknown risk model {risk_model!r}")
+
+
+def asset_volatilities(S):
+    if isinstance(S, FactorCovariance):
+        return pd.Series(S.asset_variances() ** 0.5, index=S.tickers)
+    return pd.Series(np.sqrt(np.diag(S)), index=S.index)
+
+
+def align_optimizer_prices(prices, tickers, benchmark_ticker):
+    # the Optimizer works on the dates where every ticker and the benchmark have a price
+    with span('align_dates', prices):
+        data = prices[list(dict.fromkeys(tickers))]
+        benchmark_data = prices[benchmark_ticker]
+        common_dates = data.dropna().index.intersection(benchmark_data.dropna().index)
+        return data.loc[common_dates], benchmark_data.loc[common_dates]
+
+
+def load_optimizer_prices(tickers, benchmark_ticker, start_date, end_date):
+    # one concurrent fetch for the tickers and the benchmark
+    prices = load_adj_close(list(tickers) + [benchmark_ticker], start_date, end_date)
+    return align_optimizer_prices(prices, tickers, benchmark_ticker)
+
+
+def resampled_portfolios(data, mu, S, n_samples, l2_reg=False, cache=analytics_cache):
+    samples_sharpe, samples_min_vol = _stage(cache, 'resampled_weights', resample_portfolios, data, n_samples, l2_gamma=1 if l2_reg else None,
+                                             frequency=bars_per_year(data.index))
+    averaged = []
+    for samples in [samples_sharpe, samples_min_vol]:
+        # samples without a solution are left out of the average
+        weights = samples.dropna().mean().to_numpy()
+        weights = weights / weights.sum()
+        averaged += [clean_weights(weights, list(data.columns)), portfolio_performance(weights, mu, S)]
+    return ResampledResult(*averaged, samples_sharpe, samples_min_vol)
+
+
+def optimize_prices(data, benchmark_data, initial_value, l2_reg=False, cache=analytics_cache, n_jobs=None,
+                    risk_model='ledoit_wolf', n_factors=30, resample_samples=0):
+    # each stage is cached on the content of its inputs, so e.g. an L2 toggle only re-runs the solver.
+    # mu and S are annualised by the bar frequency of the prices (252 for daily bars)
+    frequency = bars_per_year(data.index)
+    mu = _stage(cache, 'expected_returns', expected_returns.mean_historical_return, data, frequency=frequency)
+    report_progress('Estimating covariance')
+    S = _stage(cache, 'covariance', estimate_covariance, data, risk_model, n_factors, frequency)
+    report_progress('Covariance ready')
+
+    frontier, (weights_sharpe, performance_sharpe), (weights_min_vol, performance_min_vol) = _stage(
+        cache, 'frontier', compute_efficient_frontier, mu, S, l2_gamma=1 if l2_reg else None,
+        n_jobs=n_jobs if n_jobs is not None else default_frontier_jobs(len(mu))
+    )
+
+    report_progress('Backtesting portfolios', 1.0)
+    benchmark_performance = _stage(cache, 'metrics', calculate_metrics, benchmark_data)
+    cumulative_returns_sharpe = _stage(cache, 'backtest', calculate_cumulative_returns, data, pd.Series(weights_sharpe), initial_value)
+    cumulative_returns_min_vol = _stage(cache, 'backtest', calculate_cumulative_returns, data, pd.Series(weights_min_vol), initial_value)
+    cumulative_returns_benchmark = (1 + benchmark_data.pct_change().dropna()).cumprod() * initial_value
+    curves = pd.DataFrame({'Max Sharpe': cumulative_returns_sharpe, 'Min Volatility': cumulative_returns_min_vol, 'Benchmark': cumulative_returns_benchmark})
+    metrics = _stage(cache, 'metrics', performance_metrics, curves, cumulative_returns_benchmark)
+    # resampling re-estimates Ledoit-Wolf moments per sample, whichever risk model the frontier used
+    resampled = resampled_portfolios(data, mu, S, resample_samples, l2_reg, cache) if resample_samples else None
+
+    return OptimizationResult(data, benchmark_data, mu, S, frontier,
+                              weights_sharpe, performance_sharpe, weights_min_vol, performance_min_vol,
+                              benchmark_performance, cumulative_returns_sharpe, cumulative_returns_min_vol, cumulative_returns_benchmark, metrics,
+                              resampled)
+
+
+def optimize_portfolio(tickers, benchmark_ticker, start_date, end_date, initial_value, l2_reg=False, cache=analytics_cache,
+                       risk_model='ledoit_wolf', n_factors=30, resample_samples=0):
+    report_progress('Loading prices')
+    data, benchmark_data = load_optimizer_prices(tickers, benchmark_ticker, start_date, end_date)
+    report_progress('Prices loaded')
+    return optimize_prices(data, benchmark_data, initial_value, l2_reg, cache, risk_model=risk_model, n_factors=n_factors,
+                           resample_samples=resample_samples)
+
+
+def simulate_prices(prices, benchmark_prices, initial_value, weights, rebalance_period, cache=analytics_cache,
+                    rebalance_policy='calendar', drift_band=0.05, cost_rate=0.0):
+    if rebalance_policy == 'calendar' and not cost_rate:
+        # the plain calendar schedule is the one that can be checkpointed and extended
+        portfolio_history, benchmark_history, rebalance_dates, state = _stage(
+            cache, 'rebalance', start_simulation, prices, benchmark_prices, initial_value, weights, rebalance_period
+        )
+        metrics, trading_costs = state.metrics.metrics(state.periods_per_year), None
+    else:
+        portfolio_history, benchmark_history, rebalance_dates, trading_costs = _stage(
+            cache, 'rebalance', simulate_policy, prices, benchmark_prices, initial_value, weights, rebalance_policy, rebalance_period, drift_band, cost_rate
+        )
+        state = None
+        metrics = _stage(cache, 'metrics', performance_metrics, pd.DataFrame({'Portfolio': portfolio_history, 'Benchmark': benchmark_history}), benchmark_history)
+    portfolio_metrics = _stage(cache, 'metrics', calculate_metrics, portfolio_history)
+    benchmark_metrics = _stage(cache, 'metrics', calculate_metrics, benchmark_history)
+    return SimulationResult(portfolio_history, benchmark_history, rebalance_dates, portfolio_metrics, benchmark_metrics, metrics, state, trading_costs)
+
+
+def extend_simulation_prices(state, prices, benchmark_prices):
+    # only the rows after state.last_date are simulated: the histories hold just those rows,
+    # while the metrics cover the whole simulation so far
+    portfolio_history, benchmark_history, rebalance_dates, state = extend_simulation(state, prices, benchmark_prices)
+    return _state_result(portfolio_history, benchmark_history, rebalance_dates, state)
+
+
+def _state_result(portfolio_history, benchmark_history, rebalance_dates, state):
+    # metrics from the state's running sums, which cover the whole simulation whatever the histories hold
+    metrics = state.metrics.metrics(state.periods_per_year)
+    portfolio_metrics, benchmark_metrics = [tuple(metrics.loc[row, ['Annual Return', 'Annual Volatility', 'Sharpe Ratio']])
+                                            for row in ['Portfolio', 'Benchmark']]
+    return SimulationResult(portfolio_history, benchmark_history, rebalance_dates, portfolio_metrics, benchmark_metrics, metrics, state)
+
+
+def simulate_portfolio(tickers, weights, benchmark_ticker, rebalance_period, start_date, end_date, initial_value, cache=analytics_cache,
+                       rebalance_policy='calendar', drift_band=0.05, cost_rate=0.0):
+    report_progress('Loading prices')
+    prices, benchmark_prices = load_price_panel(tickers, benchmark_ticker, start_date, end_date)
+    report_progress('Simulating rebalances')
+    return simulate_prices(prices, benchmark_prices, initial_value, weights, rebalance_period, cache, rebalance_policy, drift_band, cost_rate)
+
+
+def _join_chunks(parts):
+    # a period split across two chunks appears in both; its last value is in the later one
+    history = pd.concat(parts)
+    return history[~history.index.duplicated(keep='last')]
+
+
+def stream_simulate_portfolio(tickers, weights, benchmark_ticker, rebalance_period, start_date, end_date, initial_value,
+                              chunk_rows=STREAM_CHUNK_ROWS, history_rule='D', state=None):
+    # simulate_portfolio for histories too long to load at once, e.g. years of minute bars: the price store is
+    # read in time-ordered chunks and the histories keep only the last balance of each history_rule period
+    # (None keeps every bar), so memory stays flat however many bars there are. Calendar rebalancing without
+    # costs only, since that is the schedule a SimulationState can carry. Given a state, resumes after it
+    portfolio_parts, benchmark_parts, rebalance_dates = [], [], []
+    for portfolio_history, benchmark_history, dates, state in stream_simulation(tickers, benchmark_ticker, initial_value, weights, rebalance_period,
+                                                                                start_date, end_date, chunk_rows, state):
+        if history_rule is not None:
+            portfolio_history = portfolio_history.resample(history_rule).last().dropna()
+            benchmark_history = benchmark_history.resample(history_rule).last().dropna()
+        portfolio_parts.append(portfolio_history)
+        benchmark_parts.append(benchmark_history)
+        rebalance_dates += dates
+        report_progress('Simulating rebalances', 0.0, simulated_through=state.last_date)
+
+    if not portfolio_parts:
+        empty = pd.Series(dtype=float, index=pd.DatetimeIndex([], name='Date'), name='Balance')
+        return _state_result(empty, empty.copy(), rebalance_dates, state)
+    return _state_result(_join_chunks(portfolio_parts), _join_chunks(benchmark_parts), rebalance_dates, state)
@@ -1,13 +1,376 @@
+import itertools
+from dataclasses import dataclass
+
 import pandas as pd
 import numpy as np
-import yfinance as yf
+
+from DiagnosticsUtils import span
+from JobUtils import map_chunks, report_progress
+from MetricsUtils import TRADING_DAYS_PER_YEAR, MetricAccumulator, bars_per_year, performance_metrics
+from PriceStore import get_price_store
+
+# risk and return columns reported for every combination of a strategy sweep
+SWEEP_METRIC_COLUMNS = ['Annual Return', 'Annual Volatility', 'Sharpe Ratio', 'Sortino Ratio', 'Max Drawdown', 'Calmar Ratio']
+# rows of each series read at a time when a simulation streams the price store instead of loading it whole
+STREAM_CHUNK_ROWS = 1_000_000
+# rows a streamed simulation reads ahead to infer its bar frequency (~128 sessions of minute bars), whatever its chunk_rows
+BARS_PER_YEAR_PROBE_ROWS = 50_000
 
 def load_and_prepare_data(ticker, start_date, end_date):
-    df = yf.download(ticker, start=start_date, end=end_date)
-    df.reset_index(inplace=True)
+    # served from the local price store; only date ranges it has not seen yet are downloaded
+    with span('load_prices'):
+        df = get_price_store().load(ticker, start_date, end_date)
     df['Date'] = pd.to_datetime(df['Date'])
     return df
 
+def load_many_and_prepare_data(tickers, start_date, end_date):
+    # one concurrent, de-duplicated fetch for every ticker a page needs; returns {ticker: frame}
+    with span('load_prices', tickers=len(tickers)):
+        datasets = get_price_store().load_many(tickers, start_date, end_date)
+    for df in datasets.values():
+        df['Date'] = pd.to_datetime(df['Date'])
+    return datasets
+
+def load_adj_close(tickers, start_date, end_date):
+    # wide 'Adj Close' frame for a list of tickers (a Series for a single ticker string), like yf.download(...)['Adj Close']
+    if isinstance(tickers, str):
+        df = load_and_prepare_data(tickers, start_date, end_date)
+        return df.set_index('Date')['Adj Close'].rename(tickers)
+    datasets = load_many_and_prepare_data(tickers, start_date, end_date)
+    with span('align_dates'):
+        columns = [df.set_index('Date')['Adj Close'].rename(ticker) for ticker, df in datasets.items()]
+        return pd.concat(columns, axis=1, join='outer').sort_index()
+
+REBALANCE_PERIOD_MONTHS = {
+    'annually': 12,
+    'semi-annually': 6,
+    'quarterly': 3,
+    'monthly': 1,
+    'none': np.inf
+}
+
+def align_price_panel(datasets, benchmark_data, start_date=None, end_date=None):
+    # one dense (dates x assets) price matrix on the dates every series shares
+    with span('align_dates', *datasets):
+        return _align_price_panel(datasets, benchmark_data, start_date, end_date)
+
+def _align_price_panel(datasets, benchmark_data, start_date, end_date):
+    series = [df.dropna(subset=['Adj Close']).drop_duplicates('Date').set_index('Date')['Adj Close'] for df in datasets]
+    benchmark = benchmark_data.dropna(subset=['Adj Close']).drop_duplicates('Date').set_index('Date')['Adj Close']
+    return _align_series(series, benchmark, start_date, end_date)
+
+def _align_series(series, benchmark, start_date, end_date):
+    common_dates = benchmark.index
+    for s in series:
+        common_dates = common_dates.intersection(s.index)
+    common_dates = common_dates.sort_values()
+    if start_date is not None:
+        common_dates = common_dates[common_dates >= pd.to_datetime(start_date)]
+    if end_date is not None:
+        common_dates = common_dates[common_dates <= pd.to_datetime(end_date)]
+    common_dates = common_dates.rename('Date')
+
+    prices = pd.DataFrame(np.column_stack([s.reindex(common_dates).to_numpy(dtype=float) for s in series]), index=common_dates)
+    benchmark = benchmark.reindex(common_dates).astype(float)
+    return prices, benchmark
+
+def find_rebalance_rows(dates, period_length):
+    # row positions where the calendar schedule rebalances; one search per event, not per day
+    if len(dates) < 2 or not np.isfinite(period_length):
+        return np.array([], dtype=int)
+    dates = pd.DatetimeIndex(dates)
+    month_index = dates.year.to_numpy() * 12 + dates.month.to_numpy()
+    period_length = int(period_length)
+
+    rows = []
+    last_month = month_index[0]
+    while True:
+        position = int(np.searchsorted(month_index, last_month + period_length, side='left'))
+        if position >= len(month_index):
+            break
+        rows.append(position)
+        last_month = month_index[position]
+    return np.array(rows, dtype=int)
+
+def _grow_balances(gross_returns, weights, asset_balances, rebalance_rows):
+    # balances between rebalances are a cumulative product of each segment's returns;
+    # returns the daily totals and the (drifted) asset balances after the last day
+    balances = np.empty(len(gross_returns))
+    segment_edges = np.concatenate(([0], rebalance_rows, [len(gross_returns)])).astype(int)
+    for i, (segment_start, segment_end) in enumerate(zip(segment_edges[:-1], segment_edges[1:])):
+        if segment_end > segment_start:
+            segment_balances = asset_balances * np.cumprod(gross_returns[segment_start:segment_end], axis=0)
+            balances[segment_start:segment_end] = segment_balances.sum(axis=1)
+            asset_balances = segment_balances[-1]
+        if i < len(rebalance_rows):
+            asset_balances = weights * asset_balances.sum()
+    return balances, asset_balances
+
+def _simulate_rebalancing(prices, benchmark, initial_balance, asset_weights, rebalance_period):
+    period_length = REBALANCE_PERIOD_MONTHS[rebalance_period]
+    price_matrix = np.asarray(prices, dtype=float)
+    weights = np.asarray(asset_weights, dtype=float)
+    dates = prices.index
+
+    # gross daily returns between consecutive aligned dates
+    gross_returns = price_matrix[1:] / price_matrix[:-1]
+    rebalance_rows = find_rebalance_rows(dates, period_length)
+    with span('rebalance_loop', gross_returns):
+        balances, asset_balances = _grow_balances(gross_returns, weights, weights * initial_balance, rebalance_rows)
+
+    benchmark_prices = np.asarray(benchmark, dtype=float)
+    benchmark_balances = initial_balance * benchmark_prices[1:] / benchmark_prices[0]
+
+    history_dates = dates[1:].rename('Date')
+    portfolio_history = pd.Series(balances, index=history_dates, name='Balance')
+    benchmark_history = pd.Series(benchmark_balances, index=history_dates, name='Balance')
+    rebalance_dates = list(dates[rebalance_rows])
+
+    return portfolio_history, benchmark_history, rebalance_dates, asset_balances
+
+def simulate_rebalancing(prices, benchmark, initial_balance, asset_weights, rebalance_period):
+    return _simulate_rebalancing(prices, benchmark, initial_balance, asset_weights, rebalance_period)[:3]
+
+REBALANCE_POLICIES = ['calendar', 'drift', 'hybrid']
+
+def _weight_drift(price_rows, units, target_weights):
+    # largest absolute gap between current and target weights on each of the given rows
+    values = price_rows * units
+    return np.abs(values / values.sum(axis=1, keepdims=True) - target_weights).max(axis=1)
+
+def _first_drift_breach(price_matrix, candidate_rows, units, target_weights, drift_band, window=64):
+    # candidate rows (a range or an array) are checked in doubling blocks, so a trigger k rows ahead
+    # costs O(k) vectorised work and O(log k) Python steps
+    start = 0
+    while start < len(candidate_rows):
+        block = np.asarray(candidate_rows[start:start + window])
+        breached = np.flatnonzero(_weight_drift(price_matrix[block], units, target_weights) > drift_band)
+        if len(breached):
+            return int(block[breached[0]])
+        start += window
+        window *= 2
+    return None
+
+def simulate_policy(prices, benchmark, initial_balance, asset_weights, rebalance_policy='calendar',
+                    rebalance_period='annually', drift_band=0.05, cost_rate=0.0):
+    # 'calendar' rebalances on the period schedule, 'drift' whenever any weight is more than drift_band
+    # away from its target, and 'hybrid' on schedule dates only if the drift exceeds the band then.
+    # Holdings are tracked as units, so the portfolio between events is just prices @ units and the
+    # loop jumps from one rebalance to the next. Trades pay cost_rate on their absolute value
+    if rebalance_policy not in REBALANCE_POLICIES:
+        raise ValueError(f"unknown rebalance policy {rebalance_policy!r}")
+    price_matrix = np.asarray(prices, dtype=float)
+    target_weights = np.asarray(asset_weights, dtype=float)
+    dates = prices.index
+    calendar_rows = find_rebalance_rows(dates, REBALANCE_PERIOD_MONTHS[rebalance_period])
+
+    units = target_weights * initial_balance / price_matrix[0]
+    balances = np.empty(len(price_matrix))
+    rebalance_rows, costs = [], []
+    row = 0
+    with span('rebalance_events', price_matrix):
+        while True:
+            upcoming = calendar_rows[np.searchsorted(calendar_rows, row, side='right'):]
+            if rebalance_policy == 'calendar':
+                event_row = int(upcoming[0]) if len(upcoming) else None
+            elif rebalance_policy == 'drift':
+                event_row = _first_drift_breach(price_matrix, range(row + 1, len(price_matrix)), units, target_weights, drift_band)
+            else:
+                event_row = _first_drift_breach(price_matrix, upcoming, units, target_weights, drift_band)
+
+            segment_end = len(price_matrix) if event_row is None else event_row + 1
+            balances[row:segment_end] = price_matrix[row:segment_end] @ units
+            if event_row is None:
+                break
+
+            # trade back to the targets at the event's close, paying for the turnover out of the balance
+            holdings = price_matrix[event_row] * units
+            balance = holdings.sum()
+            cost = cost_rate * np.abs(target_weights * balance - holdings).sum()
+            units = target_weights * (balance - cost) / price_matrix[event_row]
+            balances[event_row] = balance - cost
+            rebalance_rows.append(event_row)
+            costs.append(cost)
+            row = event_row
+
+    benchmark_prices = np.asarray(benchmark, dtype=float)
+    history_dates = dates[1:].rename('Date')
+    portfolio_history = pd.Series(balances[1:], index=history_dates, name='Balance')
+    benchmark_history = pd.Series(initial_balance * benchmark_prices[1:] / benchmark_prices[0], index=history_dates, name='Balance')
+    rebalance_dates = list(dates[rebalance_rows])
+    trading_costs = pd.Series(costs, index=pd.DatetimeIndex(rebalance_dates, name='Date'), name='Cost', dtype=float)
+    return portfolio_history, benchmark_history, rebalance_dates, trading_costs
+
+@dataclass
+class SimulationState:
+    # everything needed to carry a simulation forward without replaying its history; to_dict() is JSON-safe.
+    # periods_per_year annualises the metrics; it is inferred from the bars the simulation started on.
+    # tickers and benchmark (the price columns and benchmark name) identify what it may be extended with
+    weights: list
+    rebalance_period: str
+    last_date: pd.Timestamp
+    last_prices: list
+    asset_balances: list
+    last_benchmark_price: float
+    benchmark_balance: float
+    # the start date until the first rebalance; the calendar schedule counts months from here
+    last_rebalance_date: pd.Timestamp
+    rebalance_count: int
+    metrics: MetricAccumulator
+    periods_per_year: float = TRADING_DAYS_PER_YEAR
+    tickers: list = None
+    benchmark: str = None
+    initial_value: float = None
+
+    def to_dict(self):
+        state = dict(vars(self))
+        state['last_date'] = self.last_date.isoformat()
+        state['last_rebalance_date'] = self.last_rebalance_date.isoformat()
+        state['metrics'] = self.metrics.to_dict()
+        return state
+
+    @classmethod
+    def from_dict(cls, state):
+        state = dict(state)
+        state['last_date'] = pd.Timestamp(state['last_date'])
+        state['last_rebalance_date'] = pd.Timestamp(state['last_rebalance_date'])
+        state['metrics'] = MetricAccumulator.from_dict(state['metrics'])
+        return cls(**state)
+
+def start_simulation(prices, benchmark, initial_balance, asset_weights, rebalance_period, periods_per_year=None):
+    # simulate_rebalancing plus the state that extend_simulation needs to append later days; periods_per_year
+    # is inferred from the prices unless given
+    portfolio_history, benchmark_history, rebalance_dates, asset_balances = _simulate_rebalancing(
+        prices, benchmark, initial_balance, asset_weights, rebalance_period
+    )
+    weights = np.asarray(asset_weights, dtype=float)
+    price_matrix = np.asarray(prices, dtype=float)
+
+    metrics = MetricAccumulator(['Portfolio', 'Benchmark'], with_benchmark=True)
+    metrics.update(np.column_stack([portfolio_history, benchmark_history]), benchmark_history.to_numpy())
+    state = SimulationState(weights.tolist(), rebalance_period, prices.index[-1], price_matrix[-1].tolist(), asset_balances.tolist(),
+                            float(np.asarray(benchmark, dtype=float)[-1]), float(benchmark_history.iloc[-1]),
+                            rebalance_dates[-1] if rebalance_dates else prices.index[0], len(rebalance_dates), metrics,
+                            periods_per_year or bars_per_year(portfolio_history.index), [str(column) for column in prices.columns], _series_name(benchmark),
+                            float(initial_balance))
+    return portfolio_history, benchmark_history, rebalance_dates, state
+
+def _series_name(series):
+    return None if getattr(series, 'name', None) is None else str(series.name)
+
+def check_extends(state, prices, benchmark):
+    # the new rows must be prices of the same tickers and benchmark, or they would be spliced onto another portfolio
+    tickers = [str(column) for column in prices.columns]
+    if state.tickers is None:
+        raise ValueError("the simulation state does not record its tickers and benchmark, so it cannot be extended safely")
+    if tickers != state.tickers or _series_name(benchmark) != state.benchmark:
+        raise ValueError(f"the simulation state is for {state.tickers} against {state.benchmark}, "
+                         f"not {tickers} against {_series_name(benchmark)}")
+
+def extend_simulation(state, prices, benchmark):
+    # append the aligned price rows after state.last_date; costs O(new rows), not O(history)
+    check_extends(state, prices, benchmark)
+    new_rows = prices.index > state.last_date
+    prices, benchmark = prices[new_rows], benchmark[new_rows]
+    weights = np.asarray(state.weights, dtype=float)
+    price_matrix = np.vstack([state.last_prices, np.asarray(prices, dtype=float)])
+
+    # the schedule only depends on the month of the last rebalance, so it is searched from there
+    schedule_dates = pd.DatetimeIndex([state.last_rebalance_date]).append(pd.DatetimeIndex(prices.index))
+    rebalance_rows = find_rebalance_rows(schedule_dates, REBALANCE_PERIOD_MONTHS[state.rebalance_period])
+    balances, asset_balances = _grow_balances(price_matrix[1:] / price_matrix[:-1], weights, np.asarray(state.asset_balances, dtype=float), rebalance_rows)
+
+    benchmark_prices = np.asarray(benchmark, dtype=float)
+    benchmark_balances = state.benchmark_balance * benchmark_prices / state.last_benchmark_price
+
+    history_dates = prices.index.rename('Date')
+    portfolio_history = pd.Series(balances, index=history_dates, name='Balance')
+    benchmark_history = pd.Series(benchmark_balances, index=history_dates, name='Balance')
+    rebalance_dates = list(schedule_dates[rebalance_rows])
+
+    # a copy, so the caller's state is left as it was
+    metrics = MetricAccumulator.from_dict(state.metrics.to_dict())
+    metrics.update(np.column_stack([balances, benchmark_balances]), benchmark_balances)
+    if len(prices):
+        state = SimulationState(state.weights, state.rebalance_period, prices.index[-1], price_matrix[-1].tolist(), asset_balances.tolist(),
+                                float(benchmark_prices[-1]), float(benchmark_balances[-1]),
+                                rebalance_dates[-1] if rebalance_dates else state.last_rebalance_date,
+                                state.rebalance_count + len(rebalance_dates), metrics, state.periods_per_year,
+                                state.tickers, state.benchmark, state.initial_value)
+    return portfolio_history, benchmark_history, rebalance_dates, state
+
+def iter_price_panel(tickers, benchmark_ticker, start_date=None, end_date=None, chunk_rows=STREAM_CHUNK_ROWS):
+    # load_price_panel in time-ordered chunks, read straight from the stored files: each series is read
+    # chunk_rows at a time and a date is emitted once every series has been read past it, so memory depends
+    # on chunk_rows, not on the length of the history. Only what the store already holds is read
+    store = get_price_store()
+    readers = [store.iter_column(symbol, 'Adj Close', start_date, end_date, chunk_rows) for symbol in list(tickers) + [benchmark_ticker]]
+    buffers = [None] * len(readers)
+    exhausted = [False] * len(readers)
+    while True:
+        for i, reader in enumerate(readers):
+            while not exhausted[i] and (buffers[i] is None or len(buffers[i]) < chunk_rows):
+                batch = next(reader, None)
+                if batch is None:
+                    exhausted[i] = True
+                else:
+                    batch = batch.dropna()
+                    buffers[i] = batch if buffers[i] is None else pd.concat([buffers[i], batch])
+        if any(done and (buffer is None or len(buffer) == 0) for buffer, done in zip(buffers, exhausted)):
+            return
+
+        # series that may still have rows are only complete up to the last date read from them
+        open_ends = [buffer.index[-1] for buffer, done in zip(buffers, exhausted) if not done]
+        heads = buffers if not open_ends else [buffer[buffer.index <= min(open_ends)] for buffer in buffers]
+        buffers = [buffer.iloc[len(head):] for buffer, head in zip(buffers, heads)]
+        prices, benchmark = _align_series(heads[:-1], heads[-1], start_date, end_date)
+        if len(prices):
+            prices.columns = list(tickers)
+            yield prices, benchmark.rename(benchmark_ticker)
+        if not open_ends:
+            return
+
+def stream_simulation(tickers, benchmark_ticker, initial_balance, asset_weights, rebalance_period, start_date=None, end_date=None,
+                      chunk_rows=STREAM_CHUNK_ROWS, state=None):
+    # start_simulation, then extend_simulation for every further chunk of iter_price_panel, yielding each chunk's
+    # (portfolio_history, benchmark_history, rebalance_dates, state). Balances, the rebalance schedule and the
+    # metric sums carry over between chunks, so the last state is the one a whole-range simulation would end
+    # with. The bar frequency is inferred from the first BARS_PER_YEAR_PROBE_ROWS rows rather than the first
+    # chunk, so it does not depend on chunk_rows. Given a state, the simulation resumes after its last date instead
+    if state is not None:
+        start_date = state.last_date
+    else:
+        probe = iter_price_panel(tickers, benchmark_ticker, start_date, end_date, BARS_PER_YEAR_PROBE_ROWS)
+        periods_per_year = bars_per_year(next(probe, (pd.DataFrame(),))[0].index)
+        probe.close()
+    pending = None
+    for prices, benchmark in iter_price_panel(tickers, benchmark_ticker, start_date, end_date, chunk_rows):
+        if state is not None:
+            chunk = extend_simulation(state, prices, benchmark)
+        else:
+            # the first simulated return needs two rows
+            if pending is not None:
+                prices, benchmark = pd.concat([pending[0], prices]), pd.concat([pending[1], benchmark])
+            if len(prices) < 2:
+                pending = prices, benchmark
+                continue
+            chunk = start_simulation(prices, benchmark, initial_balance, asset_weights, rebalance_period, periods_per_year)
+        state = chunk[-1]
+        yield chunk
+    if state is None:
+        raise IndexError("no dates are shared by every ticker and the benchmark")
+
+def load_price_panel(file_paths, benchmark_file_path, start_date=None, end_date=None):
+    loaded = load_many_and_prepare_data(list(file_paths) + [benchmark_file_path], start_date, end_date)
+    datasets = [loaded[file_path] for file_path in file_paths]
+    benchmark_data = loaded[benchmark_file_path]
+
+    prices, benchmark = align_price_panel(datasets, benchmark_data, start_date, end_date)
+    if len(prices) == 0:
+        raise IndexError("no dates are shared by every ticker and the benchmark")
+    prices.columns = list(file_paths)
+    return prices, benchmark.rename(benchmark_file_path)
+
 def rebalance_portfolio(file_paths, 
                         benchmark_file_path,
                         initial_balance, 
@@ -15,59 +378,54 @@ def rebalance_portfolio(file_paths,
                         rebalance_period,
                         start_date=None,
                         end_date=None):
-    datasets = [load_and_prepare_data(file_path, start_date, end_date) for file_path in file_paths]
-    benchmark_data = load_and_prepare_data(benchmark_file_path, start_date, end_date)
-    period_length = {
-        'annually': 12,
-        'semi-annually': 6,
-        'quarterly': 3,
-        'monthly': 1,
-        'none': np.inf
-    }[rebalance_period]
-
-    portfolio_balance = initial_balance
-    benchmark_balance = initial_balance
-    asset_balances = [weight * initial_balance for weight in asset_weights]
-
-    common_dates = sorted(set.intersection(*(set(df['Date']) for df in datasets), set(benchmark_data['Date'])))
-    common_dates = [date for date in common_dates if (start_date is None or date >= pd.to_datetime(start_date)) and (end_date is None or date <= pd.to_datetime(end_date))]
-
-    start_date = common_dates[0]
-    last_rebalance_date = start_date
-
-    portfolio_history = []
-    benchmark_history = []
-    rebalance_dates = []
-
-    for date in common_dates:
-        if date <= start_date:
-            continue
+    prices, benchmark = load_price_panel(file_paths, benchmark_file_path, start_date, end_date)
+    return simulate_rebalancing(prices, benchmark, initial_balance, asset_weights, rebalance_period)
 
-        for i, df in enumerate(datasets):
-            previous_price = df.loc[df['Date'] < date, 'Adj Close'].iloc[-1]
-            current_price = df.loc[df['Date'] == date, 'Adj Close'].iloc[0]
-            asset_balances[i] *= current_price / previous_price
+def weight_grid(n_assets, step):
+    # every long-only weight vector on a `step` lattice that sums to 1 (stars and bars)
+    units = int(round(1 / step))
+    bars = np.array(list(itertools.combinations(range(units + n_assets - 1), n_assets - 1)), dtype=int).reshape(-1, n_assets - 1)
+    edges = np.column_stack([np.full(len(bars), -1), bars, np.full(len(bars), units + n_assets - 1)])
+    return (np.diff(edges, axis=1) - 1) / units
 
-        previous_price = benchmark_data.loc[benchmark_data['Date'] < date, 'Adj Close'].iloc[-1]
-        current_price = benchmark_data.loc[benchmark_data['Date'] == date, 'Adj Close'].iloc[0]
-        benchmark_balance *= current_price / previous_price
+def _sweep_chunk(gross_returns, weights_matrix, rebalance_rows, initial_balance, periods_per_year=TRADING_DAYS_PER_YEAR):
+    # balance paths for a block of weight vectors at once: (days, combinations)
+    balances = np.empty((len(gross_returns), len(weights_matrix)))
+    segment_edges = np.concatenate(([0], rebalance_rows, [len(gross_returns)]))
+    start_balances = np.full(len(weights_matrix), float(initial_balance))
+    for segment_start, segment_end in zip(segment_edges[:-1], segment_edges[1:]):
+        if segment_end <= segment_start:
+            continue
+        growth = np.cumprod(gross_returns[segment_start:segment_end], axis=0)
+        balances[segment_start:segment_end] = (growth @ weights_matrix.T) * start_balances
+        start_balances = balances[segment_end - 1]
 
-        portfolio_balance = sum(asset_balances)
+    # same statistics as calculate_metrics on a simulated history, one row per combination
+    metrics = performance_metrics(balances, periods_per_year=periods_per_year)
+    return np.column_stack([balances[-1], balances[-1] / initial_balance - 1, metrics[SWEEP_METRIC_COLUMNS].to_numpy()])
 
-        portfolio_history.append({'Date': date, 'Balance': portfolio_balance})
-        benchmark_history.append({'Date': date, 'Balance': benchmark_balance})
+def sweep_rebalance_strategies(prices, initial_balance, weights_matrix, rebalance_periods, chunk_size=512, n_jobs=1):
+    # every weight vector x every rebalance period over one aligned price panel
+    price_matrix = np.asarray(prices, dtype=float)
+    weights_matrix = np.atleast_2d(np.asarray(weights_matrix, dtype=float))
+    gross_returns = price_matrix[1:] / price_matrix[:-1]
+    chunks = [weights_matrix[i:i + chunk_size] for i in range(0, len(weights_matrix), chunk_size)]
+    periods_per_year = bars_per_year(prices.index[1:])
 
-        months_since_last_rebalance = (date.year - last_rebalance_date.year) * 12 + (date.month - last_rebalance_date.month)
-        if months_since_last_rebalance >= period_length:
-            desired_balances = [weight * portfolio_balance for weight in asset_weights]
-            asset_balances = desired_balances
-            last_rebalance_date = date
-            rebalance_dates.append(date)
+    jobs = []
+    for rebalance_period in rebalance_periods:
+        rebalance_rows = find_rebalance_rows(prices.index, REBALANCE_PERIOD_MONTHS[rebalance_period])
+        jobs += [(gross_returns, chunk, rebalance_rows, initial_balance, periods_per_year) for chunk in chunks]
 
-    portfolio_history = pd.DataFrame(portfolio_history).set_index('Date')['Balance']
-    benchmark_history = pd.DataFrame(benchmark_history).set_index('Date')['Balance']
+    with span('strategy_sweep', gross_returns, weights_matrix):
+        metrics = map_chunks(_sweep_chunk, jobs, n_jobs, lambda done, _: report_progress('Simulating strategies', done / len(jobs)))
 
-    return portfolio_history, benchmark_history, rebalance_dates
+    asset_names = [str(column) for column in prices.columns]
+    results = pd.DataFrame(np.tile(weights_matrix, (len(rebalance_periods), 1)), columns=asset_names)
+    results['Rebalance Period'] = np.repeat(list(rebalance_periods), len(weights_matrix))
+    metric_columns = ['Final Balance', 'Total Return'] + SWEEP_METRIC_COLUMNS
+    results[metric_columns] = np.vstack(metrics)
+    return results
 
 def calculate_cumulative_returns(data, weights, initial_value):
             returns = data.pct_change().dropna()
@@ -76,8 +434,5 @@ def calculate_cumulative_returns(data, weights, initial_value):
             return cumulative_returns
 
 def calculate_metrics(history):
-                    returns = history.pct_change().dropna()
-                    mean_return = returns.mean() * 252
-                    std_dev = returns.std() * np.sqrt(252)
-                    sharpe_ratio = mean_return / std_dev
-                    return mean_return, std_dev, sharpe_ratio
\ No newline at end of file
+                    metrics = performance_metrics(history).iloc[0]
+                    return metrics['Annual Return'], metrics['Annual Volatility'], metrics['Sharpe Ratio']
\ No newline at end of file
@@ -0,0 +1,612 @@
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+PRICE_STORE_DIR = os.environ.get("PRICE_STORE_DIR", ".price_store")
+EARLIEST_DATE = pd.Timestamp("1900-01-01")
+MAX_FETCH_WORKERS = 8
+# stored price frames kept in memory and shared by every session of the process
+PRICE_CACHE_MB = float(os.environ.get("PRICE_CACHE_MB", 256))
+# requests per second (and burst size) allowed toward Yahoo Finance across the whole process
+YAHOO_REQUESTS_PER_SECOND = float(os.environ.get("YAHOO_REQUESTS_PER_SECOND", 2))
+YAHOO_REQUEST_BURST = int(os.environ.get("YAHOO_REQUEST_BURST", 10))
+# rows per Parquet row group; streamed reads decode one group at a time, so this bounds their memory
+PARQUET_ROW_GROUP_ROWS = 1_000_000
+# part files kept per ticker before the smallest are merged (into at most PARQUET_ROW_GROUP_ROWS rows)
+PRICE_STORE_MAX_PARTS = 32
+
+
+def to_timestamp(value, default=None):
+    if value is None:
+        return default
+    value = pd.Timestamp(value)
+    if value.tzinfo is not None:
+        value = value.tz_localize(None)
+    return value.normalize()
+
+
+def empty_price_frame():
+    frame = pd.DataFrame({column: pd.Series(dtype=float) for column in PRICE_COLUMNS})
+    frame.insert(0, 'Date', pd.Series(dtype='datetime64[ns]'))
+    return frame
+
+
+def standardize_price_frame(df):
+    # Date column + the usual OHLCV columns, sorted and de-duplicated
+    if df is None or len(df) == 0:
+        return empty_price_frame()
+    df = df.copy()
+    if 'Date' not in df.columns:
+        df = df.reset_index()
+        df = df.rename(columns={df.columns[0]: 'Date'})
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    df['Date'] = pd.to_datetime(df['Date'])
+    if df['Date'].dt.tz is not None:
+        df['Date'] = df['Date'].dt.tz_localize(None)
+    if 'Adj Close' not in df.columns and 'Close' in df.columns:
+        df['Adj Close'] = df['Close']
+    for column in PRICE_COLUMNS:
+        if column not in df.columns:
+            df[column] = np.nan
+    df = df[['Date'] + PRICE_COLUMNS]
+    df = df.drop_duplicates('Date', keep='last').sort_values('Date').reset_index(drop=True)
+    return df
+
+
+def _read_only_columns(df):
+    # one read-only array per column; frames built on them share the memory, and in-place writes fail loudly
+    columns = {}
+    for column in df.columns:
+        values = df[column].to_numpy(copy=True)
+        values.flags.writeable = False
+        columns[column] = values
+    return columns
+
+
+def _frame_view(columns, start=None, stop=None):
+    return pd.DataFrame({column: values[start:stop] for column, values in columns.items()}, copy=False)
+
+
+def _segments(parts):
+    # the stored history as (start, end, part) spans in date order. Where the ranges of two parts overlap, the one
+    # written later wins, as a re-fetched tail replaces the bars that were still forming when it was first fetched
+    bounds = sorted({bound for part in parts for fetched in part['ranges'] for bound in fetched})
+    segments = []
+    for start, end in zip(bounds, bounds[1:]):
+        owner = next((part for part in reversed(parts)
+                      if any(low <= start and end <= high for low, high in part['ranges'])), None)
+        if owner is None:
+            continue
+        if segments and segments[-1][2] is owner and segments[-1][1] == start:
+            segments[-1] = (segments[-1][0], end, owner)
+        else:
+            segments.append((start, end, owner))
+    return segments
+
+
+def _iter_part(parquet, start, end, columns=None, batch_rows=PARQUET_ROW_GROUP_ROWS):
+    # rows of an open Parquet part with start <= Date < end, a batch at a time; row groups wholly outside the range
+    # are skipped by their statistics
+    date_column = parquet.schema_arrow.get_field_index('Date')
+    row_groups = []
+    for i in range(parquet.num_row_groups):
+        statistics = parquet.metadata.row_group(i).column(date_column).statistics
+        if (statistics is None or not statistics.has_min_max
+                or (pd.Timestamp(statistics.max) >= start and pd.Timestamp(statistics.min) < end)):
+            row_groups.append(i)
+    for batch in parquet.iter_batches(batch_size=batch_rows, row_groups=row_groups, columns=columns):
+        frame = batch.to_pandas()
+        frame = frame[(frame['Date'] >= start) & (frame['Date'] < end)]
+        if len(frame):
+            yield frame
+
+
+class TokenBucket:
+    # at most `rate` requests per second on average with bursts of up to `capacity`. acquire() reserves a
+    # token and sleeps until it is due, so waiting callers are served in arrival order. clock and sleep can
+    # be swapped for a fake pair in tests
+    def __init__(self, rate, capacity=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(capacity)
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+
+class NoPriceData(Exception):
+    # raised by a provider when the upstream answered but has no bars for the range; an answer, not a
+    # failure, so it is never retried
+    pass
+
+
+class PriceFetchError(Exception):
+    # raised once every retry of a fetch has failed (an outage, a rejected request or a mistyped ticker), with
+    # the last failure as its cause, so callers can report it without knowing each provider's exceptions
+    pass
+
+
+def fetch_with_retry(fetch, *args, retries=3, backoff=0.5):
+    # exponential backoff between attempts; the last failure is raised as a PriceFetchError
+    for attempt in range(retries + 1):
+        try:
+            return fetch(*args)
+        except NoPriceData:
+            raise
+        except Exception as error:
+            if attempt == retries:
+                raise PriceFetchError(f"could not fetch prices after {retries + 1} attempts: {error}") from error
+            time.sleep(backoff * 2 ** attempt)
+
+
+class PriceProvider:
+    # fetch returns a frame with a 'Date' column and PRICE_COLUMNS for start_date <= Date < end_date, raises
+    # NoPriceData if the upstream has no bars in the range, and raises anything else on failure so it is retried.
+    # fetch_many maps each ticker to its frame, or to None where the upstream confirmed there are no bars.
+    # providers whose upstream takes several symbols per request raise batch_size and override fetch_many.
+    # rate_limiter, when set, is acquired once per upstream request; as a class attribute it is process-wide
+    batch_size = 1
+    rate_limiter = None
+
+    def fetch(self, ticker, start_date, end_date):
+        raise NotImplementedError
+
+    def fetch_many(self, tickers, start_date, end_date):
+        frames = {}
+        for ticker in tickers:
+            try:
+                frames[ticker] = self.fetch(ticker, start_date, end_date)
+            except NoPriceData:
+                frames[ticker] = None
+        return frames
+
+
+class YahooProvider(PriceProvider):
+    # Ticker.history rather than yf.download: download keeps its results in module globals,
+    # so two calls running on different threads would overwrite each other. interval is Yahoo's bar size
+    # ('1d', '1h', '1m', ...); a store holds one bar size, so intraday bars need a store directory of their own
+    rate_limiter = TokenBucket(YAHOO_REQUESTS_PER_SECOND, YAHOO_REQUEST_BURST)
+
+    def __init__(self, interval='1d'):
+        self.interval = interval
+
+    def fetch(self, ticker, start_date, end_date):
+        # imported here so stores on other providers (and app start-up) never pay for yfinance
+        import yfinance as yf
+        from yfinance.exceptions import YFPricesMissingError
+        # by default history() logs a network error or a 429 and returns an empty frame, which would never be retried
+        try:
+            df = yf.Ticker(ticker).history(start=start_date, end=end_date, interval=self.interval, auto_adjust=False, raise_errors=True)
+        except YFPricesMissingError as error:
+            # also raised for an HTTP error status, which is worth retrying
+            if 'status_code' in str(error):
+                raise
+            raise NoPriceData(ticker) from error
+        return standardize_price_frame(df)
+
+
+class CSVProvider(PriceProvider):
+    # one <ticker>.csv per symbol with a Date column, e.g. a Yahoo Finance export
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fetch(self, ticker, start_date, end_date):
+        path = os.path.join(self.directory, f"{ticker}.csv")
+        if not os.path.exists(path):
+            raise NoPriceData(ticker)
+        df = standardize_price_frame(pd.read_csv(path, parse_dates=['Date']))
+        df = df[(df['Date'] >= start_date) & (df['Date'] < end_date)].reset_index(drop=True)
+        if len(df) == 0:
+            raise NoPriceData(ticker)
+        return df
+
+
+class SyntheticProvider(PriceProvider):
+    # deterministic geometric random walk per ticker; a date's price never depends on the requested range
+    def __init__(self, seed=0, origin="1970-01-01", annual_return=0.07, annual_volatility=0.2):
+        self.seed = seed
+        self.origin = pd.Timestamp(origin)
+        self.annual_return = annual_return
+        self.annual_volatility = annual_volatility
+
+    def fetch(self, ticker, start_date, end_date):
+        last_date = min(end_date, pd.Timestamp.now().normalize() + pd.Timedelta(days=1))
+        dates = pd.bdate_range(self.origin, last_date, inclusive='left')
+        if len(dates) == 0:
+            raise NoPriceData(ticker)
+
+        rng = np.random.default_rng([self.seed, zlib.crc32(ticker.encode())])
+        drift = rng.uniform(0.5, 1.5) * self.annual_return / 252
+        volatility = rng.uniform(0.5, 1.5) * self.annual_volatility / np.sqrt(252)
+        log_returns = rng.normal(drift - volatility ** 2 / 2, volatility, len(dates))
+        close = 100 * np.exp(np.cumsum(log_returns))
+        intraday = np.abs(rng.normal(0, volatility, len(dates))) * close
+
+        df = pd.DataFrame({
+            'Date': dates,
+            'Open': close * np.exp(-log_returns / 2),
+            'High': close + intraday,
+            'Low': close - intraday,
+            'Close': close,
+            'Adj Close': close,
+            'Volume': rng.integers(1_000_000, 10_000_000, len(dates)).astype(float),
+        })
+        df = df[(df['Date'] >= start_date) & (df['Date'] < end_date)].reset_index(drop=True)
+        if len(df) == 0:
+            raise NoPriceData(ticker)
+        return df
+
+
+class RecordingProvider(PriceProvider):
+    # wraps another provider (e.g. SyntheticProvider as a local stub), recording every request that reaches
+    # it and optionally adding upstream latency, to check coalescing and rate limits without a network
+    def __init__(self, provider, latency=0.0, rate_limiter=None):
+        self.provider = provider
+        self.batch_size = provider.batch_size
+        self.rate_limiter = rate_limiter
+        self.latency = latency
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def fetch_many(self, tickers, start_date, end_date):
+        with self.lock:
+            self.requests.append((time.monotonic(), tuple(tickers), start_date, end_date))
+        time.sleep(self.latency)
+        return self.provider.fetch_many(tickers, start_date, end_date)
+
+
+class PriceStore:
+    # on-disk Parquet part files per ticker, one per fetch, plus a small sidecar recording which date range has
+    # been fetched and which part holds which dates; only the uncovered part of a request ever reaches the provider. One store serves every session of the
+    # process: identical fetches already in flight are joined rather than repeated, and stored frames are
+    # kept in memory as read-only arrays that every caller's frame views without copying
+    def __init__(self, directory=PRICE_STORE_DIR, provider=None, max_age=3600, cache_mb=PRICE_CACHE_MB):
+        self.directory = directory
+        self.provider = provider if provider is not None else YahooProvider()
+        # how long a fetch that reached into the current session is trusted before it is refreshed
+        self.max_age = max_age
+        self.max_bytes = int(cache_mb * 1024 * 1024)
+        self.lock = threading.Lock()
+        # writes update the sidecar read from disk, so two of them on one ticker must not interleave
+        self.write_lock = threading.Lock()
+        # (ticker, (start, end)) -> Future resolved once that range has been fetched and written
+        self.in_flight = {}
+        # ticker -> (sidecar mtime, {column: read-only array}, size in bytes), least recently used first
+        self.frames = OrderedDict()
+        self.total_bytes = 0
+        self.counts = {'requests': 0, 'coalesced': 0, 'memory_hits': 0, 'disk_reads': 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, ticker, extension):
+        name = re.sub(r'[^A-Za-z0-9._-]', '_', ticker)
+        return os.path.join(self.directory, f"{name}.{extension}")
+
+    def _read_meta(self, ticker):
+        path = self._path(ticker, 'json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _parts(self, meta, ticker):
+        # the part files of a ticker in the order they were written, with the date ranges each was fetched for.
+        # A store written before part files holds one file for the whole covered range
+        if meta is None:
+            return []
+        if 'parts' not in meta:
+            path = self._path(ticker, 'parquet')
+            if not os.path.exists(path):
+                return []
+            import pyarrow.parquet as pq
+            meta['parts'] = [{'file': os.path.basename(path), 'rows': pq.read_metadata(path).num_rows,
+                              'ranges': [[meta['start'], meta['end']]]}]
+        return [{'file': part['file'], 'rows': part['rows'],
+                 'ranges': [(pd.Timestamp(start), pd.Timestamp(end)) for start, end in part['ranges']]}
+                for part in meta['parts']]
+
+    def _open_segments(self, ticker, start_date=None, end_date=None):
+        # the stored spans within [start_date, end_date) with their part files opened, so a compaction that removes
+        # a file meanwhile cannot pull it from under a reader
+        import pyarrow.parquet as pq
+        while True:
+            meta = self._read_meta(ticker)
+            segments, opened = [], {}
+            try:
+                for start, end, part in _segments(self._parts(meta, ticker)):
+                    start = start if start_date is None else max(start, start_date)
+                    end = end if end_date is None else min(end, end_date)
+                    if start < end:
+                        if part['file'] not in opened:
+                            # pre-buffering would keep every row group's bytes until the reader is done
+                            opened[part['file']] = pq.ParquetFile(os.path.join(self.directory, part['file']), pre_buffer=False)
+                        segments.append((start, end, opened[part['file']]))
+                return segments
+            except FileNotFoundError:
+                if self._read_meta(ticker) == meta:
+                    raise
+
+    def coverage(self, ticker):
+        meta = self._read_meta(ticker)
+        if meta is None:
+            return None
+        covered_end = pd.Timestamp(meta['end'])
+        # bars from the day the tail was fetched on may still have been forming, so they go stale
+        if time.time() - meta['fetched_at'] > self.max_age:
+            covered_end = min(covered_end, pd.Timestamp(meta['settled_end']))
+        return pd.Timestamp(meta['start']), covered_end
+
+    def missing_ranges(self, ticker, start_date, end_date):
+        if start_date >= end_date:
+            return []
+        covered = self.coverage(ticker)
+        if covered is None or covered[0] >= covered[1]:
+            return [(start_date, end_date)]
+        covered_start, covered_end = covered
+        # the stored range is kept contiguous, so a request beyond it also fetches the gap
+        missing = []
+        if start_date < covered_start:
+            missing.append((start_date, covered_start))
+        if end_date > covered_end:
+            missing.append((covered_end, end_date))
+        return missing
+
+    def _remember(self, ticker, mtime, columns):
+        size = sum(values.nbytes for values in columns.values())
+        with self.lock:
+            if ticker in self.frames:
+                self.total_bytes -= self.frames.pop(ticker)[2]
+            if size <= self.max_bytes:
+                self.frames[ticker] = (mtime, columns, size)
+                self.total_bytes += size
+                while self.total_bytes > self.max_bytes:
+                    _, (_, _, evicted_size) = self.frames.popitem(last=False)
+                    self.total_bytes -= evicted_size
+
+    def _columns(self, ticker):
+        # the stored frame as shared read-only columns; the sidecar's mtime tells if another process wrote since
+        path = self._path(ticker, 'json')
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            entry = self.frames.get(ticker)
+            if entry is not None and entry[0] == mtime:
+                self.frames.move_to_end(ticker)
+                self.counts['memory_hits'] += 1
+                return entry[1]
+            self.counts['disk_reads'] += 1
+        frames = [frame for start, end, parquet in self._open_segments(ticker) for frame in _iter_part(parquet, start, end)]
+        columns = _read_only_columns(pd.concat(frames, ignore_index=True) if frames else empty_price_frame())
+        self._remember(ticker, mtime, columns)
+        return columns
+
+    def read(self, ticker):
+        # shares memory with the in-memory copy: treat it as read-only
+        columns = self._columns(ticker)
+        return empty_price_frame() if columns is None else _frame_view(columns)
+
+    def write(self, ticker, frames, ranges):
+        with self.write_lock:
+            return self._write(ticker, frames, ranges)
+
+    def _write(self, ticker, frames, ranges):
+        # coverage only grows over ranges the provider answered for: bars came back, or it confirmed (None) that
+        # there are none. An empty frame without that confirmation may be an outage, so it is fetched again later
+        answered = [(frame, fetched) for frame, fetched in zip(frames, ranges) if frame is None or len(frame)]
+        if not answered:
+            return
+        meta = self._read_meta(ticker)
+        parts = self._parts(meta, ticker)
+
+        # each fetch is appended as a part file of its own, so nothing already stored is read or rewritten
+        for frame, (start, end) in answered:
+            if frame is not None:
+                frame = standardize_price_frame(frame)
+                frame = frame[(frame['Date'] >= start) & (frame['Date'] < end)].reset_index(drop=True)
+                if len(frame):
+                    parts.append(self._write_part(ticker, frame, [(start, end)]))
+        written = {part['file'] for part in parts}
+        parts = self._compact(ticker, parts)
+
+        range_start = min(start for _, (start, _) in answered)
+        range_end = max(end for _, (_, end) in answered)
+        if meta is None:
+            meta = {'start': str(range_start), 'end': str(range_end)}
+        meta['start'] = str(min(pd.Timestamp(meta['start']), range_start))
+        if 'fetched_at' not in meta or range_end >= pd.Timestamp(meta['settled_end']):
+            meta['end'] = str(max(pd.Timestamp(meta['end']), range_end))
+            meta['settled_end'] = str(min(pd.Timestamp(meta['end']), pd.Timestamp.now().normalize()))
+            meta['fetched_at'] = time.time()
+        meta['parts'] = [{'file': part['file'], 'rows': part['rows'],
+                          'ranges': [[str(start), str(end)] for start, end in part['ranges']]} for part in parts]
+
+        meta_path = self._path(ticker, 'json')
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+        with self.lock:
+            if ticker in self.frames:
+                self.total_bytes -= self.frames.pop(ticker)[2]
+        # only removed once the sidecar no longer lists them; a reader that has them open keeps its snapshot
+        for name in written - {part['file'] for part in parts}:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def _write_part(self, ticker, frame, ranges):
+        # write-then-rename so a concurrent reader never sees a half-written file
+        stamp = time.time_ns()
+        while os.path.exists(self._path(ticker, f"{stamp}.parquet")):
+            stamp += 1
+        path = self._path(ticker, f"{stamp}.parquet")
+        frame.to_parquet(path + '.tmp', index=False, row_group_size=PARQUET_ROW_GROUP_ROWS)
+        os.replace(path + '.tmp', path)
+        return {'file': os.path.basename(path), 'rows': len(frame), 'ranges': list(ranges)}
+
+    def _compact(self, ticker, parts):
+        # parts whose every date a later part re-fetched are dropped; past PRICE_STORE_MAX_PARTS the smallest are
+        # merged into one, reading only their own spans, so daily top-ups never make a reader open every file
+        segments = _segments(parts)
+        parts = [part for part in parts if any(owner is part for _, _, owner in segments)]
+        if len(parts) <= PRICE_STORE_MAX_PARTS:
+            return parts
+        merged, rows = [], 0
+        for part in sorted(parts, key=lambda part: part['rows']):
+            if rows + part['rows'] > PARQUET_ROW_GROUP_ROWS:
+                break
+            merged.append(part)
+            rows += part['rows']
+        if len(merged) < 2:
+            return parts
+        import pyarrow.parquet as pq
+        spans, frames = [], []
+        for start, end, owner in segments:
+            if any(owner is part for part in merged):
+                parquet = pq.ParquetFile(os.path.join(self.directory, owner['file']), pre_buffer=False)
+                frames.extend(_iter_part(parquet, start, end))
+                if spans and spans[-1][1] == start:
+                    spans[-1] = (spans[-1][0], end)
+                else:
+                    spans.append((start, end))
+        combined = self._write_part(ticker, pd.concat(frames, ignore_index=True), spans)
+        return [part for part in parts if not any(part is other for other in merged)] + [combined]
+
+    def _fetch(self, tickers, start_date, end_date):
+        if self.provider.rate_limiter is not None:
+            self.provider.rate_limiter.acquire()
+        with self.lock:
+            self.counts['requests'] += 1
+        return self.provider.fetch_many(tickers, start_date, end_date)
+
+    def _finish(self, led, error=None):
+        with self.lock:
+            for missing, group in led.items():
+                for ticker in group:
+                    future = self.in_flight.pop((ticker, missing))
+                    if error is None:
+                        future.set_result(None)
+                    else:
+                        future.set_exception(error)
+
+    def load_many(self, tickers, start_date=None, end_date=None, max_workers=MAX_FETCH_WORKERS, retries=3, backoff=0.5):
+        start_date = to_timestamp(start_date, EARLIEST_DATE)
+        end_date = to_timestamp(end_date, pd.Timestamp.now().normalize() + pd.Timedelta(days=1))
+        tickers = list(dict.fromkeys(tickers))
+        self.fill(tickers, start_date, end_date, max_workers, retries, backoff)
+
+        # every result is a view on the shared in-memory columns: treat it as read-only
+        results = {}
+        for ticker in tickers:
+            columns = self._columns(ticker)
+            if columns is None:
+                results[ticker] = empty_price_frame()
+                continue
+            dates = columns['Date']
+            rows = np.searchsorted(dates, [start_date.to_datetime64(), end_date.to_datetime64()])
+            results[ticker] = _frame_view(columns, *rows)
+        return results
+
+    def fill(self, tickers, start_date=None, end_date=None, max_workers=MAX_FETCH_WORKERS, retries=3, backoff=0.5):
+        # fetch and store whatever part of the range is not stored yet, without reading anything back
+        start_date = to_timestamp(start_date, EARLIEST_DATE)
+        end_date = to_timestamp(end_date, pd.Timestamp.now().normalize() + pd.Timedelta(days=1))
+        tickers = list(dict.fromkeys(tickers))
+
+        # a range another caller is already fetching is waited for, not fetched again; the rest is ours to
+        # fetch, grouped by range so a batching provider can take several symbols in one request
+        led, waiting = {}, []
+        with self.lock:
+            for ticker in tickers:
+                for missing in self.missing_ranges(ticker, start_date, end_date):
+                    if (ticker, missing) in self.in_flight:
+                        waiting.append(self.in_flight[(ticker, missing)])
+                    else:
+                        self.in_flight[(ticker, missing)] = Future()
+                        led.setdefault(missing, []).append(ticker)
+            self.counts['coalesced'] += len(waiting)
+        batch_size = max(1, self.provider.batch_size)
+        batches = [(missing, group[i:i + batch_size])
+                   for missing, group in led.items()
+                   for i in range(0, len(group), batch_size)]
+
+        try:
+            fetched = {}
+            if batches:
+                with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+                    futures = {pool.submit(fetch_with_retry, self._fetch, batch, missing[0], missing[1],
+                                           retries=retries, backoff=backoff): missing
+                               for missing, batch in batches}
+                    for future in as_completed(futures):
+                        for ticker, frame in future.result().items():
+                            fetched.setdefault(ticker, []).append((futures[future], frame))
+            for ticker, parts in fetched.items():
+                self.write(ticker, [frame for _, frame in parts], [missing for missing, _ in parts])
+        except BaseException as error:
+            self._finish(led, error)
+            raise
+        # only released once written, so a waiter reads what was fetched for it
+        self._finish(led)
+        for future in waiting:
+            future.result()
+
+    def iter_column(self, ticker, column='Adj Close', start_date=None, end_date=None, batch_rows=PARQUET_ROW_GROUP_ROWS):
+        # the stored column for start_date <= Date < end_date as Series of up to batch_rows, in date order. Read
+        # from the part files a row group at a time, skipping groups outside the range by their statistics, and
+        # never through the in-memory frames, so a history of any length streams in bounded memory. The files are
+        # opened up front and stay a consistent snapshot even if a write adds or removes parts meanwhile
+        start_date = to_timestamp(start_date, EARLIEST_DATE)
+        end_date = to_timestamp(end_date, pd.Timestamp.now().normalize() + pd.Timedelta(days=1))
+        for start, end, parquet in self._open_segments(ticker, start_date, end_date):
+            for frame in _iter_part(parquet, start, end, ['Date', column], batch_rows):
+                yield frame.set_index('Date')[column]
+
+    def stats(self):
+        # upstream requests made, requests joined to one already in flight, and how stored frames were served
+        with self.lock:
+            return pd.Series({**self.counts, 'cached_tickers': len(self.frames), 'cached_mb': self.total_bytes / 1024 / 1024})
+
+    def load(self, ticker, start_date=None, end_date=None):
+        return self.load_many([ticker], start_date, end_date)[ticker]
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_price_store():
+    # one store per process, so concurrent sessions share its in-flight fetches and in-memory frames
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = PriceStore()
+    return _default_store
+
+
+def configure_price_store(directory=PRICE_STORE_DIR, provider=None, max_age=3600, cache_mb=PRICE_CACHE_MB):
+    global _default_store
+    _default_store = PriceStore(directory, provider, max_age, cache_mb)
+    return _default_store
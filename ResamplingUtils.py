@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from FrontierUtils import RISK_FREE_RATE
+from JobUtils import map_chunks, report_progress
+from MonteCarloUtils import TRADING_DAYS_PER_MONTH, BlockBootstrapSampler
+from WalkForwardUtils import RefitProblem
+
+# bootstrap samples are drawn and estimated this many values (samples x days x assets) at a time
+RESAMPLE_BLOCK_ELEMENTS = 5_000_000
+# samples per chunk of work, fewer if their covariances (samples x assets x assets) would exceed
+# RESAMPLE_COVARIANCE_ELEMENTS; a chunk draws, estimates and solves its own samples, so only the
+# chunks being worked on hold covariances. Fixed sizes keep the result independent of the worker count
+RESAMPLE_CHUNK_SAMPLES = 50
+RESAMPLE_COVARIANCE_ELEMENTS = 5_000_000
+
+
+def batched_moments(returns, frequency=252):
+    # pypfopt's mean_historical_return and CovarianceShrinkage(...).ledoit_wolf() for a stack of
+    # (samples, days, assets) daily returns at once: one batched matmul instead of a loop over samples
+    n_days, n_assets = returns.shape[1:]
+    mu = np.expm1(np.log1p(returns).mean(axis=1) * frequency)
+
+    # same estimator as sklearn.covariance.ledoit_wolf, with every reduction kept per sample
+    X = returns - returns.mean(axis=1, keepdims=True)
+    emp_cov = np.matmul(X.transpose(0, 2, 1), X) / n_days
+    average_variance = np.trace(emp_cov, axis1=1, axis2=2) / n_assets
+    frobenius2 = np.sum(emp_cov ** 2, axis=(1, 2))
+    norm4_sum = np.sum(np.einsum('bti,bti->bt', X, X) ** 2, axis=1)
+    delta = (frobenius2 - n_assets * average_variance ** 2) / n_assets
+    beta = np.minimum((norm4_sum / n_days - frobenius2) / (n_assets * n_days), delta)
+    shrinkage = np.divide(beta, delta, out=np.zeros_like(beta), where=beta != 0)
+    shrunk = (1 - shrinkage)[:, None, None] * emp_cov + (shrinkage * average_variance)[:, None, None] * np.eye(n_assets)
+    return mu, shrunk * frequency
+
+
+def bootstrap_moments(gross_returns, n_samples=1000, block_length=TRADING_DAYS_PER_MONTH, frequency=252, seed=0):
+    # expected returns (samples x assets) and covariances (samples x assets x assets) of bootstrap samples
+    # as long as the history, drawn in blocks so memory stays bounded
+    sampler = BlockBootstrapSampler(gross_returns, block_length)
+    rng = np.random.default_rng(seed)
+    n_days, n_assets = sampler.gross_returns.shape
+    mu = np.empty((n_samples, n_assets))
+    S = np.empty((n_samples, n_assets, n_assets))
+    chunk = max(1, RESAMPLE_BLOCK_ELEMENTS // (n_days * n_assets))
+    for start in range(0, n_samples, chunk):
+        stop = min(start + chunk, n_samples)
+        mu[start:stop], S[start:stop] = batched_moments(sampler.sample(rng, stop - start, n_days) - 1, frequency)
+    return mu, S
+
+
+def _solve_samples(gross_returns, n_samples, block_length, frequency, seed, l2_gamma, weight_bounds, risk_free_rate):
+    # bootstrap one chunk of samples, then one compiled max-Sharpe and one min-volatility program for all of
+    # them; each sample only updates their parameters and starts from the previous sample's weights.
+    # NaN rows mark samples with no solution
+    mu, S = bootstrap_moments(gross_returns, n_samples, block_length, frequency, seed)
+    results = []
+    for objective in ['max_sharpe', 'min_volatility']:
+        problem = RefitProblem(mu.shape[1], objective, l2_gamma, weight_bounds, risk_free_rate)
+        weights = np.full(mu.shape, np.nan)
+        previous = None
+        for i in range(len(mu)):
+            try:
+                previous = weights[i] = problem.solve(mu[i], S[i], previous)
+            except ValueError:
+                # e.g. no asset beat the risk-free rate in this sample
+                continue
+        results.append(weights)
+    return results
+
+
+def default_resample_jobs(n_samples):
+    return min(os.cpu_count() or 1, 8) if n_samples >= 200 else 1
+
+
+def resample_portfolios(prices, n_samples=1000, block_length=TRADING_DAYS_PER_MONTH, l2_gamma=None, weight_bounds=(0, 1),
+                        risk_free_rate=RISK_FREE_RATE, frequency=252, n_jobs=None, seed=0):
+    # Michaud-style resampling: re-estimate mu and S on bootstrap samples of the aligned returns and solve
+    # max-Sharpe and min-volatility on each. Returns the per-sample weights (samples x tickers) of both;
+    # their averages are the resampled portfolios, their spread shows how much the estimates can be trusted
+    gross_returns = (prices / prices.shift(1)).iloc[1:].to_numpy(dtype=float)
+    chunk = max(1, min(RESAMPLE_CHUNK_SAMPLES, RESAMPLE_COVARIANCE_ELEMENTS // prices.shape[1] ** 2))
+    sizes = [min(chunk, n_samples - start) for start in range(0, n_samples, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(gross_returns, size, block_length, frequency, chunk_seed, l2_gamma, weight_bounds, risk_free_rate)
+            for size, chunk_seed in zip(sizes, seeds)]
+
+    n_jobs = n_jobs or default_resample_jobs(n_samples)
+    solved = map_chunks(_solve_samples, jobs, n_jobs, lambda done, _: report_progress('Solving resampled portfolios', done / len(jobs)))
+
+    weights_sharpe, weights_min_vol = [pd.DataFrame(np.vstack(weights), columns=prices.columns) for weights in zip(*solved)]
+    return weights_sharpe, weights_min_vol
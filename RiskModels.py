@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+# above this many tickers a dense N x N covariance gets expensive, so the factor model is the better default
+FACTOR_MODEL_MIN_TICKERS = 300
+
+
+class FactorCovariance:
+    # covariance stored as B B' + diag(d): k statistical factors plus asset-specific variance.
+    # Memory is O(N k), and portfolio risk is ||B'w||^2 + sum(d w^2), so the N x N matrix is never built
+    def __init__(self, loadings, specific_variance, tickers=None):
+        self.loadings = np.asarray(loadings, dtype=float)
+        self.specific_variance = np.asarray(specific_variance, dtype=float)
+        self.tickers = list(tickers) if tickers is not None else list(range(len(self.specific_variance)))
+
+    @classmethod
+    def from_prices(cls, prices, n_factors=30, frequency=252, random_state=0):
+        # scikit-learn and cvxpy are imported on first use, so the app can read FACTOR_MODEL_MIN_TICKERS cheaply
+        from sklearn.utils.extmath import randomized_svd
+        returns = prices.pct_change().dropna(how='all').fillna(0.0)
+        X = returns.to_numpy(dtype=float)
+        X = X - X.mean(axis=0)
+        n_factors = max(1, min(n_factors, min(X.shape) - 1))
+
+        # truncated SVD of the T x N returns: the leading principal components of the sample covariance
+        _, singular_values, components = randomized_svd(X, n_factors, random_state=random_state)
+        loadings = components.T * singular_values / np.sqrt(len(X) - 1)
+        total_variance = X.var(axis=0, ddof=1)
+        # whatever the factors leave unexplained is asset-specific, floored so every asset keeps some risk
+        specific_variance = np.maximum(total_variance - np.sum(loadings ** 2, axis=1), 1e-4 * total_variance.mean())
+        return cls(loadings * np.sqrt(frequency), specific_variance * frequency, prices.columns)
+
+    def risk_expression(self, weights):
+        import cvxpy as cp
+        return cp.sum_squares(self.loadings.T @ weights) + cp.sum(cp.multiply(self.specific_variance, cp.square(weights)))
+
+    def portfolio_variance(self, weights):
+        # one value per row of a (portfolios x assets) weight matrix, or a scalar for a single vector
+        weights = np.asarray(weights, dtype=float)
+        return np.sum((weights @ self.loadings) ** 2, axis=-1) + (weights ** 2) @ self.specific_variance
+
+    def asset_variances(self):
+        return np.sum(self.loadings ** 2, axis=1) + self.specific_variance
+
+    def to_dense(self):
+        # only for small universes, e.g. to compare against Ledoit-Wolf
+        return pd.DataFrame(self.loadings @ self.loadings.T + np.diag(self.specific_variance), index=self.tickers, columns=self.tickers)
+
+    def __len__(self):
+        return len(self.specific_variance)
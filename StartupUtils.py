@@ -0,0 +1,53 @@
+import importlib
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from DiagnosticsUtils import span
+
+# modules behind the Optimizer and Simulator actions (pypfopt, cvxpy, scipy, scikit-learn, matplotlib).
+# app.py loads them on first use, and pre-warms them in the background once a page has been drawn
+HEAVY_MODULES = ['matplotlib.figure', 'ChartUtils', 'PortfolioAPI', 'WalkForwardUtils', 'ResamplingUtils']
+
+# module -> seconds the first load() of it took in this process, including everything it pulled in
+import_times = {}
+_prewarm_lock = threading.Lock()
+_prewarm_thread = None
+
+
+def load(name):
+    # the module, imported on first use; the import is timed as a diagnostics span and in import_times
+    if name in sys.modules:
+        # still goes through the import system, which waits if another thread is midway through importing it
+        return importlib.import_module(name)
+    start = time.perf_counter()
+    with span(f"import {name}"):
+        module = importlib.import_module(name)
+    import_times.setdefault(name, time.perf_counter() - start)
+    return module
+
+
+def _prewarm():
+    for name in HEAVY_MODULES:
+        load(name)
+    # the first cvxpy solve in a process also pays for canonicalisation and solver set-up
+    frontier = load('FrontierUtils')
+    frontier.compute_efficient_frontier(pd.Series([0.04, 0.06, 0.08]), np.diag([0.01, 0.02, 0.04]), points=3)
+
+
+def prewarm():
+    # once per process, on a daemon thread: later imports of the same modules just wait for it to finish
+    global _prewarm_thread
+    with _prewarm_lock:
+        if _prewarm_thread is None:
+            _prewarm_thread = threading.Thread(target=_prewarm, name="portfolio-prewarm", daemon=True)
+            _prewarm_thread.start()
+    return _prewarm_thread
+
+
+def import_report():
+    # what the loads in this process cost, slowest first
+    return pd.Series(import_times, name='Import Time (s)', dtype=float).sort_values(ascending=False)
@@ -0,0 +1,186 @@
+import cvxpy as cp
+import numpy as np
+import pandas as pd
+
+from FrontierUtils import FRONTIER_SOLVER, RISK_FREE_RATE
+from JobUtils import report_progress
+from MetricsUtils import bars_per_year
+from PortfolioUtils import REBALANCE_PERIOD_MONTHS, find_rebalance_rows
+
+
+class RollingMoments:
+    # sufficient statistics of a sliding window of daily returns. Adding or dropping k rows costs
+    # O(k * N^2), so sliding a window forward never rescans it. They are enough to reproduce
+    # pypfopt's mean_historical_return and CovarianceShrinkage(...).ledoit_wolf() on the window
+    def __init__(self, n_assets):
+        self.count = 0
+        self.log_growth = np.zeros(n_assets)
+        self.sum = np.zeros(n_assets)
+        self.cross = np.zeros((n_assets, n_assets))
+        # sum of |r|^2 * r and of |r|^4 over rows, needed for the Ledoit-Wolf shrinkage intensity
+        self.norm2_weighted_sum = np.zeros(n_assets)
+        self.norm4_sum = 0.0
+
+    def _update(self, rows, sign):
+        rows = np.asarray(rows, dtype=float)
+        if len(rows) == 0:
+            return
+        norms = np.einsum('ij,ij->i', rows, rows)
+        self.count += sign * len(rows)
+        self.log_growth += sign * np.log1p(rows).sum(axis=0)
+        self.sum += sign * rows.sum(axis=0)
+        self.cross += sign * rows.T @ rows
+        self.norm2_weighted_sum += sign * norms @ rows
+        self.norm4_sum += sign * float(norms @ norms)
+
+    def add(self, rows):
+        self._update(rows, 1)
+
+    def remove(self, rows):
+        self._update(rows, -1)
+
+    def mean_historical_return(self, frequency=252):
+        return np.expm1(self.log_growth * frequency / self.count)
+
+    def ledoit_wolf(self, frequency=252):
+        n = self.count
+        p = len(self.sum)
+        mean = self.sum / n
+        # centred second and fourth moments, expanded so they only use the running sums
+        emp_cov = self.cross / n - np.outer(mean, mean)
+        mean_norm2 = float(mean @ mean)
+        centred_norm4_sum = (self.norm4_sum
+                             + 4 * float(mean @ self.cross @ mean)
+                             + n * mean_norm2 ** 2
+                             - 4 * float(mean @ self.norm2_weighted_sum)
+                             + 2 * mean_norm2 * float(np.trace(self.cross))
+                             - 4 * mean_norm2 * float(mean @ self.sum))
+
+        # same estimator as sklearn.covariance.ledoit_wolf, which pypfopt calls
+        mu = np.trace(emp_cov) / p
+        frobenius2 = float(np.sum(emp_cov ** 2))
+        delta = (frobenius2 - 2 * mu * np.trace(emp_cov) + p * mu ** 2) / p
+        beta = min((centred_norm4_sum / n - frobenius2) / (p * n), delta)
+        shrinkage = 0.0 if beta == 0 else beta / delta
+        shrunk = (1 - shrinkage) * emp_cov + shrinkage * mu * np.eye(p)
+        return shrunk * frequency
+
+
+class RefitProblem:
+    # max-Sharpe or min-volatility with mu and a covariance factor as cvxpy Parameters: the problem is
+    # compiled once for the whole walk-forward and every refit starts from the previous weights
+    def __init__(self, n_assets, objective='max_sharpe', l2_gamma=None, weight_bounds=(0, 1), risk_free_rate=RISK_FREE_RATE):
+        self.objective = objective
+        self.risk_free_rate = risk_free_rate
+        self.weight_bounds = weight_bounds
+        self.mu = cp.Parameter(n_assets)
+        self.factor = cp.Parameter((n_assets, n_assets))
+        low, high = weight_bounds
+
+        if objective == 'max_sharpe':
+            # the usual homogenisation: minimise y'Sy subject to (mu - rf)'y = 1, then w = y / k
+            self.variable = cp.Variable(n_assets)
+            self.scale = cp.Variable()
+            risk = cp.sum_squares(self.factor @ self.variable)
+            if l2_gamma:
+                risk = risk + l2_gamma * cp.sum_squares(self.variable)
+            constraints = [
+                (self.mu - risk_free_rate) @ self.variable == 1,
+                cp.sum(self.variable) == self.scale,
+                self.scale >= 0,
+                self.variable >= low * self.scale,
+                self.variable <= high * self.scale,
+            ]
+        elif objective == 'min_volatility':
+            self.variable = cp.Variable(n_assets)
+            self.scale = None
+            risk = cp.sum_squares(self.factor @ self.variable)
+            if l2_gamma:
+                risk = risk + l2_gamma * cp.sum_squares(self.variable)
+            constraints = [cp.sum(self.variable) == 1, self.variable >= low, self.variable <= high]
+        else:
+            raise ValueError(f"unknown objective {objective!r}")
+        self.problem = cp.Problem(cp.Minimize(risk), constraints)
+
+    def solve(self, mu, S, previous_weights=None):
+        self.mu.value = np.asarray(mu, dtype=float)
+        self.factor.value = np.linalg.cholesky(S + 1e-10 * np.eye(len(S))).T
+        if self.objective == 'max_sharpe' and np.max(mu) <= self.risk_free_rate:
+            raise ValueError("max-Sharpe needs at least one asset returning more than the risk-free rate")
+        if previous_weights is not None:
+            if self.scale is None:
+                self.variable.value = previous_weights
+            else:
+                excess = float((np.asarray(mu) - self.risk_free_rate) @ previous_weights)
+                if excess > 0:
+                    self.scale.value = 1 / excess
+                    self.variable.value = previous_weights / excess
+        # a solve that raises leaves the previous refit's status and weights in place, so it counts as failed
+        try:
+            self.problem.solve(solver=FRONTIER_SOLVER, warm_start=True)
+            solved = self.problem.status in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE)
+        except cp.SolverError:
+            solved = False
+        if not solved:
+            try:
+                self.problem.solve(warm_start=True)
+            except cp.SolverError as error:
+                raise ValueError(f"could not solve the {self.objective} refit") from error
+            if (self.problem.status not in (cp.OPTIMAL, cp.OPTIMAL_INACCURATE) or self.variable.value is None
+                    or (self.scale is not None and not (self.scale.value or 0) > 0)):
+                raise ValueError(f"could not solve the {self.objective} refit")
+        weights = self.variable.value if self.scale is None else self.variable.value / self.scale.value
+        # solver tolerance can leave weights a hair outside their bounds
+        weights = np.clip(weights, *self.weight_bounds)
+        return weights / weights.sum()
+
+
+def walk_forward_backtest(prices,
+                          initial_value,
+                          objective='max_sharpe',
+                          refit_period='quarterly',
+                          lookback_days=756,
+                          l2_gamma=None,
+                          weight_bounds=(0, 1),
+                          risk_free_rate=RISK_FREE_RATE,
+                          frequency=None):
+    # re-optimise on a trailing window at every refit date, hold the weights (letting them drift)
+    # until the next refit, and chain the out-of-sample segments into one equity curve.
+    # lookback_days counts bars; frequency defaults to bars_per_year() of the prices
+    returns = prices.pct_change().iloc[1:]
+    return_matrix = returns.to_numpy(dtype=float)
+    if len(return_matrix) <= lookback_days:
+        raise ValueError(f"walk-forward needs more than {lookback_days} days of history")
+
+    refit_rows = lookback_days + np.concatenate(([0], find_rebalance_rows(returns.index[lookback_days:], REBALANCE_PERIOD_MONTHS[refit_period])))
+    frequency = frequency or bars_per_year(prices.index)
+    moments = RollingMoments(return_matrix.shape[1])
+    problem = RefitProblem(return_matrix.shape[1], objective, l2_gamma, weight_bounds, risk_free_rate)
+
+    balances = np.empty(len(return_matrix) - lookback_days)
+    weight_history = []
+    balance = float(initial_value)
+    window_start, window_end = 0, 0
+    weights = None
+    for refit, (refit_row, next_refit_row) in enumerate(zip(refit_rows, np.append(refit_rows[1:], len(return_matrix)))):
+        report_progress(f"Walk-forward refits ({objective.replace('_', ' ')})", refit / len(refit_rows))
+        # slide the window to [refit_row - lookback_days, refit_row) by adding and dropping only the rows that changed
+        moments.add(return_matrix[window_end:refit_row])
+        moments.remove(return_matrix[window_start:refit_row - lookback_days])
+        window_start, window_end = refit_row - lookback_days, refit_row
+
+        try:
+            weights = problem.solve(moments.mean_historical_return(frequency), moments.ledoit_wolf(frequency), weights)
+        except ValueError:
+            # e.g. no asset beat the risk-free rate in this window; keep the current allocation
+            weights = weights if weights is not None else np.full(return_matrix.shape[1], 1 / return_matrix.shape[1])
+        weight_history.append(weights)
+
+        growth = np.cumprod(1 + return_matrix[refit_row:next_refit_row], axis=0)
+        segment = balance * (growth @ weights)
+        balances[refit_row - lookback_days:next_refit_row - lookback_days] = segment
+        balance = segment[-1]
+
+    equity_curve = pd.Series(balances, index=returns.index[lookback_days:], name='Balance')
+    weight_history = pd.DataFrame(weight_history, index=returns.index[refit_rows], columns=prices.columns)
+    return equity_curve, weight_history
@@ -1,16 +1,147 @@
+import time
+
 import streamlit as st
 import pandas as pd
-import numpy as np
-import yfinance as yf
-import matplotlib.pyplot as plt
-from pypfopt import EfficientFrontier, risk_models, expected_returns, plotting
 from datetime import datetime
-from pypfopt.objective_functions import L2_reg
-
-from PortfolioUtils import load_and_prepare_data, rebalance_portfolio, calculate_cumulative_returns, calculate_metrics
+from math import comb
+
+# only modules that are cheap to import are imported here; pypfopt, cvxpy, scikit-learn and matplotlib
+# are loaded by StartupUtils.load() when an action first needs them (see HEAVY_MODULES)
+from PortfolioUtils import load_price_panel, weight_grid, sweep_rebalance_strategies
+from CacheUtils import analytics_cache
+from PriceStore import PriceFetchError, get_price_store
+from MonteCarloUtils import BlockBootstrapSampler, GaussianSampler, project_portfolio
+from MetricsUtils import bars_per_year, rolling_metrics
+from RiskModels import FACTOR_MODEL_MIN_TICKERS
+from DiagnosticsUtils import DIAGNOSTICS_ENABLED, begin_diagnostics, enable_json_logging, end_diagnostics, span
+from JobUtils import submit_job
+from StartupUtils import import_report, load, prewarm
 from OptContentManager import OptContent
 from SimContentManager import SimContent
 
+PERCENT_METRICS = ['CAGR', 'Annual Return', 'Annual Volatility', 'Max Drawdown', 'Tracking Error']
+
+
+def format_metrics(metrics):
+    # metrics table with the return and risk columns shown in percent; durations are counted in bars, which are
+    # trading days for daily prices but hours or minutes for intraday ones
+    table = metrics.copy()
+    percent_columns = list(table.columns.intersection(PERCENT_METRICS))
+    table[percent_columns] = table[percent_columns] * 100
+    labels = {column: f"{column} (%)" for column in percent_columns}
+    labels['Max Drawdown Duration'] = "Max Drawdown Duration (bars)"
+    return table.rename(columns=labels).round(2)
+
+def reuse_figure(name, figsize=None, **kwargs):
+    # one figure per chart and session, cleared and redrawn on each rerun rather than a new figure every time.
+    # Kept in the session outside pyplot, whose registry would hold every session's figures for the process's life
+    figures = st.session_state.setdefault('figures', {})
+    fig = figures.get(name)
+    if fig is None:
+        fig = figures[name] = load('matplotlib.figure').Figure(figsize=figsize)
+    else:
+        fig.clear()
+    return fig, fig.subplots(**kwargs)
+
+
+def show_figure(name, fig):
+    # rasterising and sending the image is a stage of its own
+    with span(f"render_{name}_chart"):
+        st.pyplot(fig)
+
+def current_job(name, key):
+    # this session's job for one section of the page, dropped (and cancelled, if still running) once its inputs change
+    job = st.session_state.get(name)
+    if job is not None and job.key != key:
+        job.cancel()
+        del st.session_state[name]
+        job = None
+    return job
+
+
+def start_job(name, key, compute, *args, **kwargs):
+    # a click while the same inputs are already running (or done) attaches to that job instead of starting another
+    job = current_job(name, key)
+    if job is None:
+        job = st.session_state[name] = submit_job(key, compute, *args, **kwargs)
+    return job
+
+
+def wait_for_job(job, draw_partial=None, poll_seconds=0.25):
+    # the script waits here but the page stays live: progress and partial results are redrawn as the job
+    # reports them, and any widget change interrupts the wait with a rerun, which cancels the job if its inputs changed
+    status = st.progress(0.0, text="Queued")
+    partial_area = st.empty()
+    drawn = None
+    while not job.done():
+        stage, fraction, partial, version = job.progress()
+        status.progress(min(fraction, 1.0), text=stage)
+        if draw_partial is not None and partial and version != drawn:
+            draw_partial(partial_area, partial)
+            drawn = version
+        time.sleep(poll_seconds)
+    status.empty()
+    partial_area.empty()
+    return job.result()
+
+
+def traced(stage, compute, **details):
+    # compute inside a diagnostics span, so a background job still shows up as one stage
+    def run(*args, **kwargs):
+        with span(stage, **details):
+            return compute(*args, **kwargs)
+    return run
+
+
+def run_optimizer(tickers, benchmark_ticker, start_date, end_date, initial_value, l2_reg, risk_model, n_factors, resample_samples,
+                  walk_forward, refit_period, lookback_years):
+    with span('optimize_portfolio', tickers=len(tickers)):
+        result = load('PortfolioAPI').optimize_portfolio(tickers, benchmark_ticker, start_date, end_date, initial_value, l2_reg, risk_model=risk_model, n_factors=n_factors,
+                                    resample_samples=resample_samples)
+    walk_forward_curves, walk_forward_error = None, None
+    if walk_forward:
+        try:
+            with span('walk_forward', result.data):
+                walk_forward_curves = [analytics_cache.get_or_compute('walk_forward', load('WalkForwardUtils').walk_forward_backtest, result.data, initial_value, objective, refit_period,
+                                                                      round(bars_per_year(result.data.index)) * lookback_years, 1 if l2_reg else None)[0]
+                                       for objective in ['max_sharpe', 'min_volatility']]
+        except ValueError as e:
+            walk_forward_error = e
+    return result, walk_forward_curves, walk_forward_error
+
+
+def run_projection(tickers, weights, benchmark_ticker, start_date, end_date, initial_value, rebalance_period, method, years, paths):
+    projection_weights = pd.Series(weights, index=tickers).groupby(level=0, sort=False).sum()
+    prices, _ = load_price_panel(list(projection_weights.index), benchmark_ticker, start_date, end_date)
+    if method == "Block bootstrap of history":
+        sampler = BlockBootstrapSampler((prices / prices.shift(1)).iloc[1:].to_numpy())
+    else:
+        sampler = GaussianSampler(load('pypfopt.expected_returns').mean_historical_return(prices), load('PortfolioAPI').ledoit_wolf_covariance(prices))
+    with span('projection', prices, paths=paths):
+        bands, summary = analytics_cache.get_or_compute('projection', project_portfolio, sampler, initial_value, projection_weights.to_numpy(), rebalance_period,
+                                                        horizon_days=252 * years, n_paths=paths)
+    return prices.index[-1], bands, summary
+
+
+def run_sweep(tickers, benchmark_ticker, start_date, end_date, initial_value, step, periods):
+    prices, _ = load_price_panel(list(tickers), benchmark_ticker, start_date, end_date)
+    return analytics_cache.get_or_compute('sweep', sweep_rebalance_strategies, prices, initial_value, weight_grid(len(tickers), step / 100), list(periods))
+
+
+def resampled_weights_table(weights, samples):
+    # averaged weights next to the range they took across bootstrap samples, in percent
+    table = pd.DataFrame({
+        'Weight (%)': pd.Series(weights),
+        'Sample 5th pct (%)': samples.quantile(0.05),
+        'Sample 95th pct (%)': samples.quantile(0.95),
+    }) * 100
+    return table.sort_values(by='Weight (%)', ascending=False).round(2)
+
+
+def draw_partial_frontier(area, partial):
+    if 'frontier' in partial:
+        area.scatter_chart(partial['frontier'], x='Volatility', y='Return')
+
 # Set the page configuration
 st.set_page_config(
     page_title="Portfolio Management Toolkit",  # Title of the web page
@@ -26,6 +157,11 @@ st.title("Portfolio Management Toolkit")
 header = st.sidebar.title("⚙️ Settings")
 divider = st.sidebar.divider()
 page = st.sidebar.selectbox("Select Portfolio Tool", ["Optimizer", "Simulator"], help= "Select the portfolio tool youd like to use")
+show_diagnostics = st.sidebar.checkbox("Show Diagnostics", help="Time every stage of this run and show where the time and memory went")
+# spans are only recorded (and logged as JSON) while a recorder is active, so this is free when off
+diagnostics = begin_diagnostics(show_diagnostics or DIAGNOSTICS_ENABLED)
+if diagnostics is not None:
+    enable_json_logging()
 # Common inputs
 start_date = st.sidebar.date_input("Start Date", value=pd.to_datetime("2000-01-01"), help="Select the start date for the analysis")
 end_date = st.sidebar.date_input("End Date", value=pd.Timestamp.now(),  help="Select the end date for the analysis")
@@ -69,64 +205,80 @@ if page ==  "Optimizer":
         [L2 Regularization](https://en.wikipedia.org/wiki/Ridge_regression) has been enabled. This promotes diversification by penalizing large weights in the portfolio. 
         """)
 
-
+    # a k-factor covariance keeps the optimizer fast on universes of thousands of tickers
+    risk_model = st.selectbox("Risk Model", ["Ledoit-Wolf shrinkage", "Statistical factor model"],
+                              index=1 if len(tickers) >= FACTOR_MODEL_MIN_TICKERS else 0,
+                              help="The factor model describes covariance with a few principal components plus asset-specific risk, so it never builds the full covariance matrix")
+    n_factors = 30
+    if risk_model == "Statistical factor model":
+        n_factors = st.slider("Number of Factors", min_value=1, max_value=100, value=30)
+
+    # averaging the optimal weights over bootstrap samples of the history smooths out estimation noise
+    resample = st.checkbox("Resampled Weights", disabled=len(tickers) >= FACTOR_MODEL_MIN_TICKERS,
+                           help="Re-estimate returns and covariance on bootstrap samples of the history, optimize each sample, and average the weights")
+    resample_samples = 0
+    if resample:
+        resample_samples = st.select_slider("Bootstrap Samples", options=[250, 500, 1000, 2500, 5000], value=1000)
+
+    # out-of-sample backtest: refit on a trailing window and hold the weights until the next refit
+    walk_forward = st.checkbox("Walk-Forward Backtest", help="Also backtest the strategies out-of-sample by re-optimizing on a trailing window at every refit date")
+    refit_period, lookback_years = "quarterly", 3
+    if walk_forward:
+        refit_period = st.selectbox("Refit Frequency", ["monthly", "quarterly"], index=1)
+        lookback_years = st.slider("Lookback Window (years)", min_value=1, max_value=10, value=3)
+
+
+    # the optimization runs in the background; the page polls it and the frontier fills in as points are solved
+    optimizer_inputs = (tuple(tickers), benchmark_ticker, start_date, end_date, initial_value, l2_reg,
+                        'factor' if risk_model == "Statistical factor model" else 'ledoit_wolf', n_factors, resample_samples,
+                        walk_forward, refit_period, lookback_years)
+    optimizer_job = current_job('optimizer_job', optimizer_inputs)
     if st.button("Optimize Portfolio"):
-        data = yf.download(tickers, start=start_date, end=end_date)['Adj Close']
-        benchmark_data = yf.download(benchmark_ticker, start=start_date, end=end_date)['Adj Close']
-
-        # align dates
-        common_dates = data.dropna().index.intersection(benchmark_data.dropna().index)
-        data = data.loc[common_dates]
-        benchmark_data = benchmark_data.loc[common_dates]
-
-        # calculating expected returns and covariance matrix using Ledoit-Wolf Shrinkage Method
-        mu = expected_returns.mean_historical_return(data)
-        S = risk_models.CovarianceShrinkage(data).ledoit_wolf()
-
-        # run optimization and plot it
-        ef = EfficientFrontier(mu, S)
-
-        # Conditionally add L2 regularization
-        if l2_reg:
-            ef.add_objective(L2_reg)
-
-        fig, ax = plt.subplots(figsize=(12, 8))
-        plotting.plot_efficient_frontier(ef, ax=ax, show_assets=True, show_tickers=True)
-        plt.title("Efficient Frontier", fontsize=25)
-        plt.xlabel("Risk (Standard Deviation)", fontsize=17)
-        plt.ylabel("Expected Return", fontsize=17)
-        plt.grid(True)
-        plt.legend()
+        optimizer_job = start_job('optimizer_job', optimizer_inputs, run_optimizer, *optimizer_inputs)
+
+    if optimizer_job is not None:
+        result, walk_forward_curves, walk_forward_error = wait_for_job(optimizer_job, draw_partial_frontier)
+        charts = load('ChartUtils')
+        data, benchmark_data, mu, S, frontier = result.data, result.benchmark_data, result.mu, result.S, result.frontier
+        weights_sharpe, performance_sharpe = result.weights_sharpe, result.performance_sharpe
+        weights_min_vol, performance_min_vol = result.weights_min_vol, result.performance_min_vol
+
+        fig, ax = reuse_figure("frontier", figsize=(12, 8))
+        ax.plot(frontier['Volatility'], frontier['Return'], label="Efficient frontier")
+        volatilities = load('PortfolioAPI').asset_volatilities(S)
+        ax.scatter(volatilities, mu, s=30, color="k", label="assets")
+        # labels are unreadable (and slow to draw) on large universes
+        if len(mu) <= 50:
+            for ticker, asset_volatility, asset_return in zip(mu.index, volatilities, mu):
+                ax.annotate(ticker, (asset_volatility, asset_return))
+        ax.set_title("Efficient Frontier", fontsize=25)
+        ax.set_xlabel("Risk (Standard Deviation)", fontsize=17)
+        ax.set_ylabel("Expected Return", fontsize=17)
+        ax.grid(True)
+        ax.legend()
 
         for text in ax.texts:
             text.set_fontsize(14)
 
-        ef_sharpe = EfficientFrontier(mu, S)
-        if l2_reg:
-            ef_sharpe.add_objective(L2_reg)
-        ef_min_vol = EfficientFrontier(mu, S)
-        if l2_reg:
-            ef_min_vol.add_objective(L2_reg)
-
         # Show max sharpe portfolio
-        ef_sharpe.max_sharpe()
-        weights_sharpe = ef_sharpe.clean_weights()
-        performance_sharpe = ef_sharpe.portfolio_performance(verbose=True)
         ret_sharpe, std_sharpe, _ = performance_sharpe
         ax.scatter(std_sharpe, ret_sharpe, marker="*", s=150, c="g", label="Max Sharpe")
         ax.annotate('Max Sharpe Weighting', xy=(std_sharpe, ret_sharpe), xytext=(std_sharpe + 0.005, ret_sharpe),
                     arrowprops=dict(facecolor='green', shrink=0.05), fontsize=20, color='green')
 
         # Show the min volatility portfolio only if target return is disabled (otherwise they'll be the same)
-        ef_min_vol.min_volatility()
-        weights_min_vol = ef_min_vol.clean_weights()
-        performance_min_vol = ef_min_vol.portfolio_performance(verbose=True)
         ret_min_vol, std_min_vol, _ = performance_min_vol
         ax.scatter(std_min_vol, ret_min_vol, marker="*", s=150, c="b", label="Min Volatility")
         ax.annotate('Min Volatility Weighting', xy=(std_min_vol, ret_min_vol), xytext=(std_min_vol + 0.005, ret_min_vol),
                     arrowprops=dict(facecolor='blue', shrink=0.05), fontsize=20, color='blue')
 
-        st.pyplot(fig)
+        # resampled portfolios sit inside the frontier: they give up some in-sample optimality for robustness
+        if result.resampled is not None:
+            ax.scatter(result.resampled.performance_sharpe[1], result.resampled.performance_sharpe[0], marker="P", s=150, c="g", label="Resampled Max Sharpe")
+            ax.scatter(result.resampled.performance_min_vol[1], result.resampled.performance_min_vol[0], marker="P", s=150, c="b", label="Resampled Min Volatility")
+            ax.legend()
+
+        show_figure("frontier", fig)
 
         st.subheader("Maximum Sharpe Portfolio Metrics")
         st.write(f"**Expected annual return:** {performance_sharpe[0]*100:.2f}%")
@@ -148,13 +300,24 @@ if page ==  "Optimizer":
         weights_min_vol_df.columns = ['Weight (%)']
         st.dataframe(weights_min_vol_df)
 
+        if result.resampled is not None:
+            resampled = result.resampled
+            st.subheader("Resampled Portfolios")
+            st.write(f"""
+            Averages of the optimal weights over {len(resampled.samples_sharpe):,} bootstrap samples of the returns, scored on the full-sample estimates.
+            The sample percentiles show how far each weight moves when the history is redrawn.
+            """)
+            for name, weights, performance, samples in [("Resampled Max Sharpe", resampled.weights_sharpe, resampled.performance_sharpe, resampled.samples_sharpe),
+                                                        ("Resampled Min Volatility", resampled.weights_min_vol, resampled.performance_min_vol, resampled.samples_min_vol)]:
+                st.write(f"**{name}:** expected annual return {performance[0]*100:.2f}%, annual volatility {performance[1]*100:.2f}%, Sharpe Ratio {performance[2]:.2f}")
+                st.dataframe(resampled_weights_table(weights, samples))
+
         # Calculate benchmark performance
-        benchmark_returns = benchmark_data.pct_change().dropna()
-        benchmark_cumulative_returns = (1 + benchmark_returns).cumprod() * initial_value
+        benchmark_mean, benchmark_std, benchmark_sharpe = result.benchmark_performance
         benchmark_performance = {
-            "Expected annual return": benchmark_returns.mean() * 252,
-            "Annual volatility": benchmark_returns.std() * np.sqrt(252),
-            "Sharpe Ratio": (benchmark_returns.mean() * 252) / (benchmark_returns.std() * np.sqrt(252))
+            "Expected annual return": benchmark_mean,
+            "Annual volatility": benchmark_std,
+            "Sharpe Ratio": benchmark_sharpe
         }
 
         st.subheader(f"{benchmark_ticker} (Benchmark) Metrics")
@@ -168,20 +331,42 @@ if page ==  "Optimizer":
         (NOTE: The start date is adjusted so all data is available at the time)
         """)
 
-        cumulative_returns_sharpe = calculate_cumulative_returns(data, pd.Series(weights_sharpe), initial_value)
-        cumulative_returns_min_vol = calculate_cumulative_returns(data, pd.Series(weights_min_vol), initial_value)
-        cumulative_returns_benchmark = (1 + benchmark_data.pct_change().dropna()).cumprod() * initial_value
-
-        fig, ax = plt.subplots(figsize=(12, 8))
-        cumulative_returns_sharpe.plot(ax=ax, label='Max Sharpe Ratio Portfolio')
-        cumulative_returns_min_vol.plot(ax=ax, label='Min Volatility Portfolio')
-        cumulative_returns_benchmark.plot(ax=ax, label=f'{benchmark_ticker} (Benchmark)')
-        plt.title(f"Performance of Portfolios ({start_date} to {end_date})", fontsize=18)
-        plt.xlabel("Date", fontsize=14)
-        plt.ylabel("Portfolio Value", fontsize=14)
-        plt.legend()
-        plt.grid(True)
-        st.pyplot(fig)
+        fig, ax = reuse_figure("performance", figsize=(12, 8))
+        charts.plot_downsampled(ax, result.cumulative_returns_sharpe, label='Max Sharpe Ratio Portfolio')
+        charts.plot_downsampled(ax, result.cumulative_returns_min_vol, label='Min Volatility Portfolio')
+        charts.plot_downsampled(ax, result.cumulative_returns_benchmark, label=f'{benchmark_ticker} (Benchmark)')
+        ax.set_title(f"Performance of Portfolios ({start_date} to {end_date})", fontsize=18)
+        ax.set_xlabel("Date", fontsize=14)
+        ax.set_ylabel("Portfolio Value", fontsize=14)
+        ax.legend()
+        ax.grid(True)
+        show_figure("performance", fig)
+
+        st.write("### Risk Metrics")
+        st.dataframe(format_metrics(result.metrics))
+
+        if walk_forward:
+            st.write(f"""
+            ### Walk-Forward (Out-of-Sample) Performance
+            Weights are re-optimized {refit_period} using only the previous {lookback_years} years of data and held until the next refit, so no result uses information from the future.
+            """)
+            if walk_forward_error is not None:
+                st.error(f"An error occurred: {walk_forward_error}")
+            else:
+                walk_forward_sharpe, walk_forward_min_vol = walk_forward_curves
+                walk_forward_benchmark = benchmark_data.loc[walk_forward_sharpe.index]
+                walk_forward_benchmark = walk_forward_benchmark / benchmark_data.shift(1).loc[walk_forward_sharpe.index[0]] * initial_value
+
+                fig, ax = reuse_figure("walk_forward", figsize=(12, 8))
+                charts.plot_downsampled(ax, walk_forward_sharpe, label='Max Sharpe Ratio Portfolio (walk-forward)')
+                charts.plot_downsampled(ax, walk_forward_min_vol, label='Min Volatility Portfolio (walk-forward)')
+                charts.plot_downsampled(ax, walk_forward_benchmark, label=f'{benchmark_ticker} (Benchmark)')
+                ax.set_title("Walk-Forward Performance of Portfolios", fontsize=18)
+                ax.set_xlabel("Date", fontsize=14)
+                ax.set_ylabel("Portfolio Value", fontsize=14)
+                ax.legend()
+                ax.grid(True)
+                show_figure("walk_forward", fig)
 
         st.write("Tool Created by Alan")
 
@@ -220,33 +405,48 @@ elif page == "Simulator":
         st.error("The number of tickers must match the number of weights.")
     else:
         rebalance_period = st.selectbox("Select Rebalance Period", ["annually", "semi-annually", "quarterly", "monthly", "none"])
-
+        rebalance_policies = {
+            "Calendar": 'calendar',
+            "Drift band": 'drift',
+            "Hybrid (calendar dates, only past the band)": 'hybrid',
+        }
+        rebalance_policy = rebalance_policies[st.radio("Rebalance Policy", list(rebalance_policies), horizontal=True,
+                                                       help="Drift band rebalances whenever any weight moves more than the band away from its target")]
+        drift_band = 0.05
+        if rebalance_policy != 'calendar':
+            drift_band = st.slider("Drift band (%)", min_value=1, max_value=25, value=5) / 100
+        cost_rate = st.number_input("Transaction cost (bp of traded value)", min_value=0.0, max_value=200.0, value=0.0, step=5.0) / 10000
+
+        simulation_inputs = (tuple(tickers), tuple(weights), benchmark_ticker, rebalance_period, start_date, end_date, initial_value, rebalance_policy, drift_band, cost_rate)
+        simulation_job = current_job('simulation_job', simulation_inputs)
         if st.button("Simulate Portfolio"):
+            simulation_job = start_job('simulation_job', simulation_inputs, traced('simulate_portfolio', load('PortfolioAPI').simulate_portfolio, tickers=len(tickers)),
+                                       tickers, weights, benchmark_ticker, rebalance_period, start_date, end_date, initial_value,
+                                       rebalance_policy=rebalance_policy, drift_band=drift_band, cost_rate=cost_rate)
+
+        if simulation_job is not None:
             try:
-                portfolio_history, benchmark_history, rebalance_dates = rebalance_portfolio(
-                    tickers, benchmark_ticker, initial_value, weights, rebalance_period, start_date, end_date
-                )
+                simulation = wait_for_job(simulation_job)
+                charts = load('ChartUtils')
+                portfolio_history, benchmark_history, rebalance_dates = simulation.portfolio_history, simulation.benchmark_history, simulation.rebalance_dates
 
                 st.write("### Portfolio Balance Over Time")
-                fig, ax = plt.subplots(figsize=(12, 8))
-                portfolio_history.plot(ax=ax, label='Portfolio')
-                benchmark_history.plot(ax=ax, label=f'{benchmark_ticker} (Benchmark)')
-                for i, rebalance_date in enumerate(rebalance_dates):
-                    ax.axvline(x=rebalance_date, color='r', linestyle='--', lw=0.5)
-                    if i == 0:  # Add label only for the first rebalance line
-                        ax.axvline(x=rebalance_date, color='r', linestyle='--', lw=0.5, label='Rebalance')
-                plt.title("Portfolio Balance Over Time", fontsize=18)
-                plt.xlabel("Date", fontsize=14)
-                plt.ylabel("Balance", fontsize=14)
-                plt.legend()
-                plt.grid(False)
-                st.pyplot(fig)
+                fig, ax = reuse_figure("balance", figsize=(12, 8))
+                charts.plot_downsampled(ax, portfolio_history, label='Portfolio')
+                charts.plot_downsampled(ax, benchmark_history, label=f'{benchmark_ticker} (Benchmark)')
+                charts.plot_markers(ax, rebalance_dates, colors='r', linestyles='--', linewidths=0.5, label='Rebalance')
+                ax.set_title("Portfolio Balance Over Time", fontsize=18)
+                ax.set_xlabel("Date", fontsize=14)
+                ax.set_ylabel("Balance", fontsize=14)
+                ax.legend()
+                ax.grid(False)
+                show_figure("balance", fig)
 
                 st.write("### Rebalance Dates")
                 st.write(rebalance_dates)
 
-                mean_return_portfolio, std_dev_portfolio, sharpe_ratio_portfolio = calculate_metrics(portfolio_history)
-                mean_return_benchmark, std_dev_benchmark, sharpe_ratio_benchmark = calculate_metrics(benchmark_history)
+                mean_return_portfolio, std_dev_portfolio, sharpe_ratio_portfolio = simulation.portfolio_metrics
+                mean_return_benchmark, std_dev_benchmark, sharpe_ratio_benchmark = simulation.benchmark_metrics
 
                 st.write("### Portfolio Performance Metrics")
                 st.write(f"**Expected Annual Return:** {mean_return_portfolio * 100:.2f}%")
@@ -258,10 +458,113 @@ elif page == "Simulator":
                 st.write(f"**Annual Volatility (Standard Deviation):** {std_dev_benchmark * 100:.2f}%")
                 st.write(f"**Sharpe Ratio:** {sharpe_ratio_benchmark:.2f}")
 
+                st.write("### Risk Metrics")
+                st.dataframe(format_metrics(simulation.metrics))
+
+                # a one-year window, however many bars a year of these prices holds
+                if len(portfolio_history) > bars_per_year(portfolio_history.index):
+                    rolling = rolling_metrics(pd.DataFrame({'Portfolio': portfolio_history, 'Benchmark': benchmark_history}))
+                    fig, (ax_sharpe, ax_drawdown) = reuse_figure("rolling", nrows=2, ncols=1, figsize=(14, 8), sharex=True)
+                    for column in rolling['Sharpe Ratio']:
+                        charts.plot_downsampled(ax_sharpe, rolling['Sharpe Ratio'][column], label=column)
+                        charts.plot_downsampled(ax_drawdown, rolling['Max Drawdown'][column] * 100)
+                    ax_sharpe.legend()
+                    ax_sharpe.set_title("Rolling 1-Year Sharpe Ratio")
+                    ax_drawdown.set_title("Rolling 1-Year Max Drawdown (%)")
+                    show_figure("rolling", fig)
+
                 st.write("### Portfolio and Benchmark Ending Values")
                 st.write(f"**Final Portfolio Balance:** ${portfolio_history.iloc[-1]:,.2f}")
                 st.write(f"**Final Benchmark Balance:** ${benchmark_history.iloc[-1]:,.2f}")
+                if simulation.trading_costs is not None:
+                    st.write(f"**Transaction Costs Paid:** ${simulation.trading_costs.sum():,.2f} over {len(rebalance_dates)} rebalances")
                 st.write("Tool Created by Alan ")
-            except IndexError as e:
+            except (IndexError, PriceFetchError) as e:
+                st.error(f"An error occurred: {e}")
+
+        st.write("""
+        ### Forward Projection
+        Simulate many possible futures for this allocation and rebalance schedule, either by replaying random blocks of its own history or by sampling from the Ledoit-Wolf estimates of its returns and covariance.
+        """)
+        projection_years = st.slider("Projection horizon (years)", min_value=1, max_value=30, value=10)
+        projection_paths = st.selectbox("Number of simulated paths", [10_000, 50_000, 100_000, 250_000], index=2)
+        projection_method = st.radio("Return model", ["Block bootstrap of history", "Ledoit-Wolf normal"], horizontal=True)
+
+        projection_inputs = (tuple(tickers), tuple(weights), benchmark_ticker, start_date, end_date, initial_value, rebalance_period,
+                             projection_method, projection_years, projection_paths)
+        projection_job = current_job('projection_job', projection_inputs)
+        if st.button("Project Portfolio"):
+            projection_job = start_job('projection_job', projection_inputs, run_projection, *projection_inputs)
+
+        if projection_job is not None:
+            try:
+                last_date, bands, summary = wait_for_job(projection_job)
+                band_dates = pd.bdate_range(last_date, periods=bands.index[-1] + 1)[bands.index]
+
+                fig, ax = reuse_figure("projection", figsize=(12, 8))
+                ax.fill_between(band_dates, bands['P5'], bands['P95'], color='tab:blue', alpha=0.15, label='5th-95th percentile')
+                ax.fill_between(band_dates, bands['P25'], bands['P75'], color='tab:blue', alpha=0.35, label='25th-75th percentile')
+                ax.plot(band_dates, bands['P50'], color='tab:blue', label='Median')
+                ax.set_title(f"Projected Portfolio Balance ({projection_paths:,} paths)", fontsize=18)
+                ax.set_xlabel("Date", fontsize=14)
+                ax.set_ylabel("Balance", fontsize=14)
+                ax.legend()
+                show_figure("projection", fig)
+
+                summary.columns = ["5th", "25th", "50th", "75th", "95th"]
+                st.write("### Projected Outcomes by Percentile")
+                st.write("**Terminal Balance:** " + ", ".join(f"{column}: ${value:,.0f}" for column, value in summary.loc['Terminal Balance'].items()))
+                st.write("**Max Drawdown:** " + ", ".join(f"{column}: {value * 100:.1f}%" for column, value in summary.loc['Max Drawdown'].items()))
+            except (IndexError, PriceFetchError) as e:
+                st.error(f"An error occurred: {e}")
+
+        st.write("""
+        ### Strategy Sweep
+        Grid-search every allocation of these tickers against several rebalance schedules at once.
+        """)
+        sweep_step = st.number_input("Weight step (%)", min_value=1, max_value=50, value=10, help="Every allocation whose weights are multiples of this step is tested")
+        sweep_periods = st.multiselect("Rebalance periods to sweep", ["annually", "semi-annually", "quarterly", "monthly", "none"], default=["annually", "semi-annually", "quarterly", "monthly", "none"])
+        sweep_tickers = list(dict.fromkeys(tickers))
+        sweep_size = comb(int(round(100 / sweep_step)) + len(sweep_tickers) - 1, len(sweep_tickers) - 1) * len(sweep_periods)
+        st.write(f"{sweep_size:,} strategies will be simulated.")
+
+        sweep_inputs = (tuple(sweep_tickers), benchmark_ticker, start_date, end_date, initial_value, sweep_step, tuple(sweep_periods))
+        sweep_job = current_job('sweep_job', sweep_inputs)
+        if st.button("Run Strategy Sweep"):
+            if sweep_size == 0:
+                st.error("Select at least one rebalance period.")
+            elif sweep_size > 500_000:
+                st.error("That grid is too large. Increase the weight step or sweep fewer tickers.")
+            else:
+                sweep_job = start_job('sweep_job', sweep_inputs, run_sweep, *sweep_inputs)
+
+        if sweep_job is not None:
+            try:
+                st.session_state['sweep_results'] = (sweep_inputs, wait_for_job(sweep_job))
+            except (IndexError, PriceFetchError) as e:
                 st.error(f"An error occurred: {e}")
 
+        # kept with the inputs it was run for, so a table from other tickers, dates or periods is never shown
+        sweep_key, sweep_results = st.session_state.get('sweep_results', (None, None))
+        if sweep_key == sweep_inputs:
+            sort_by = st.selectbox("Sort strategies by", ["Sharpe Ratio", "Sortino Ratio", "Calmar Ratio", "Final Balance", "Annual Return", "Annual Volatility", "Max Drawdown"])
+            sweep_table = sweep_results.sort_values(by=sort_by, ascending=(sort_by == "Annual Volatility"))
+            weight_columns = list(sweep_results.columns[:sweep_results.columns.get_loc('Rebalance Period')])
+            sweep_table[weight_columns] = sweep_table[weight_columns] * 100
+            st.dataframe(sweep_table.reset_index(drop=True), column_config={column: st.column_config.NumberColumn(f"{column} (%)", format="%.0f") for column in weight_columns})
+
+# hit/miss counters for sizing ANALYTICS_CACHE_MB and PRICE_CACHE_MB; rendered last so they include this run
+with st.sidebar.expander("Cache Statistics"):
+    st.dataframe(analytics_cache.stats())
+    st.dataframe(get_price_store().stats().to_frame('Price Store'))
+
+if diagnostics is not None:
+    end_diagnostics(diagnostics)
+    if show_diagnostics:
+        with st.sidebar.expander("Diagnostics", expanded=True):
+            st.dataframe(diagnostics.table(), hide_index=True)
+            # what each deferred import cost this process the first time it was needed
+            st.dataframe(import_report())
+
+# the page is drawn: load the compute pipeline in the background so the first click does not wait for it
+prewarm()
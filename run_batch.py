@@ -0,0 +1,267 @@
+"""Run many portfolio jobs headlessly.
+
+    python run_batch.py specs.json --output results.csv [--histories histories.parquet] [--workers 4] [--provider synthetic]
+
+A spec file is a JSON list (or JSON lines, or a CSV with ';'-separated lists) of portfolios:
+
+    {"name": "60/40", "tickers": ["SPY", "TLT"], "weights": [0.6, 0.4], "start_date": "2005-01-01",
+     "end_date": "2024-01-01", "rebalance_period": "annually", "benchmark": "SPY", "initial_value": 10000}
+
+"job" may be "simulate" (default) or "optimize"; optimize jobs ignore weights and rebalance_period and
+accept "risk_model" ("ledoit_wolf" or "factor") and "n_factors". Simulate jobs may set "rebalance_policy"
+("calendar", "drift" or "hybrid"), "drift_band" (e.g. 0.05) and "cost_rate" (e.g. 0.001 for 10 bp per trade).
+Prices for every spec are loaded once up front and shared by all workers.
+
+With --state states.json, each simulate job's end state is saved under its name. On the next run a job
+with the same tickers, benchmark, initial value, weights and calendar schedule only simulates the days
+after its saved state, so daily updates of long-lived portfolios cost O(new days); --histories then
+holds just the new rows.
+
+A calendar simulate job with "chunk_rows" (e.g. 1000000) streams its prices from the store that many rows
+at a time instead of loading them up front, so memory stays flat for long intraday histories (point
+--store at a store of minute or hourly bars). Its history holds the last balance of each day, or of each
+"history_rule" period ("h", "W", ...). Metrics are annualised by the bar frequency of the prices.
+"""
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from PortfolioAPI import align_optimizer_prices, extend_simulation_prices, optimize_prices, simulate_prices, stream_simulate_portfolio
+from PortfolioUtils import SimulationState, align_price_panel
+from PriceStore import EARLIEST_DATE, PRICE_STORE_DIR, CSVProvider, PriceFetchError, SyntheticProvider, YahooProvider, configure_price_store, get_price_store, to_timestamp
+
+SPEC_DEFAULTS = {
+    'job': 'simulate',
+    'rebalance_period': 'annually',
+    'rebalance_policy': 'calendar',
+    'drift_band': 0.05,
+    'cost_rate': 0.0,
+    'benchmark': 'SPY',
+    'initial_value': 10000,
+    'start_date': None,
+    'end_date': None,
+    'l2_reg': False,
+    'risk_model': 'ledoit_wolf',
+    'n_factors': 30,
+    'chunk_rows': None,
+    'history_rule': 'D',
+}
+
+_shared_datasets = None
+
+
+def read_specs(path):
+    if path.endswith('.csv'):
+        specs = pd.read_csv(path, dtype=str, keep_default_na=False).to_dict('records')
+        for spec in specs:
+            spec['tickers'] = [ticker.strip() for ticker in spec['tickers'].split(';')]
+            if spec.get('weights'):
+                spec['weights'] = [float(weight) for weight in spec['weights'].split(';')]
+            if spec.get('initial_value'):
+                spec['initial_value'] = float(spec['initial_value'])
+            for key in ('n_factors', 'chunk_rows'):
+                if spec.get(key):
+                    spec[key] = int(spec[key])
+            for key in ('drift_band', 'cost_rate'):
+                if spec.get(key):
+                    spec[key] = float(spec[key])
+            spec['l2_reg'] = str(spec.get('l2_reg', '')).lower() in ('1', 'true', 'yes')
+            for key in list(spec):
+                if spec[key] == '':
+                    del spec[key]
+    else:
+        with open(path) as f:
+            text = f.read()
+        specs = json.loads(text) if text.lstrip().startswith('[') else [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    prepared = []
+    for i, spec in enumerate(specs):
+        spec = {**SPEC_DEFAULTS, **spec}
+        spec.setdefault('name', f"portfolio_{i}")
+        prepared.append(spec)
+    return prepared
+
+
+def _init_worker(datasets, store_directory=None):
+    global _shared_datasets
+    _shared_datasets = datasets
+    # streamed jobs read the store the parent filled, however the worker was started
+    if store_directory is not None:
+        configure_price_store(store_directory)
+
+
+def _streamed(spec):
+    return spec['job'] == 'simulate' and bool(spec['chunk_rows'])
+
+
+def _slice(df, start_date, end_date):
+    return df[(df['Date'] >= start_date) & (df['Date'] < end_date)]
+
+
+def _job_start(spec):
+    # a resumed job only needs prices from its last simulated day on
+    if spec.get('state'):
+        return pd.Timestamp(spec['state']['last_date'])
+    return to_timestamp(spec['start_date'], EARLIEST_DATE)
+
+
+def run_job(spec):
+    start_date = _job_start(spec)
+    end_date = to_timestamp(spec['end_date'], pd.Timestamp.now().normalize() + pd.Timedelta(days=1))
+    if not _streamed(spec):
+        datasets = [_slice(_shared_datasets[ticker], start_date, end_date) for ticker in spec['tickers']]
+        benchmark_data = _slice(_shared_datasets[spec['benchmark']], start_date, end_date)
+    summary = {'name': spec['name'], 'job': spec['job'], 'error': None}
+    history = None
+    state = None
+
+    try:
+        if spec['job'] == 'optimize':
+            frames = {ticker: df.set_index('Date')['Adj Close'] for ticker, df in zip(spec['tickers'] + [spec['benchmark']], datasets + [benchmark_data])}
+            data, benchmark_prices = align_optimizer_prices(pd.DataFrame(frames), spec['tickers'], spec['benchmark'])
+            result = optimize_prices(data, benchmark_prices, spec['initial_value'], spec['l2_reg'], cache=None, n_jobs=1,
+                                     risk_model=spec['risk_model'], n_factors=spec['n_factors'])
+            for label, weights, performance in [('max_sharpe', result.weights_sharpe, result.performance_sharpe),
+                                                ('min_volatility', result.weights_min_vol, result.performance_min_vol)]:
+                summary[f"{label}_return"], summary[f"{label}_volatility"], summary[f"{label}_sharpe"] = performance
+                summary[f"{label}_weights"] = json.dumps(weights)
+            summary['benchmark_return'], summary['benchmark_volatility'], summary['benchmark_sharpe'] = result.benchmark_performance
+        else:
+            if _streamed(spec):
+                if spec['rebalance_policy'] != 'calendar' or spec['cost_rate']:
+                    raise ValueError("streamed simulations only support calendar rebalancing without trading costs")
+                resume = SimulationState.from_dict(spec['state']) if spec.get('state') else None
+                result = stream_simulate_portfolio(spec['tickers'], spec['weights'], spec['benchmark'], spec['rebalance_period'], start_date, end_date,
+                                                   spec['initial_value'], spec['chunk_rows'], spec['history_rule'], resume)
+            else:
+                prices, benchmark_prices = align_price_panel(datasets, benchmark_data)
+                if len(prices) == 0:
+                    raise IndexError("no dates are shared by every ticker and the benchmark")
+                # named, so a saved state records what it simulated
+                prices.columns = list(spec['tickers'])
+                benchmark_prices = benchmark_prices.rename(spec['benchmark'])
+                if spec.get('state'):
+                    result = extend_simulation_prices(SimulationState.from_dict(spec['state']), prices, benchmark_prices)
+                else:
+                    result = simulate_prices(prices, benchmark_prices, spec['initial_value'], spec['weights'], spec['rebalance_period'], cache=None,
+                                             rebalance_policy=spec['rebalance_policy'], drift_band=spec['drift_band'], cost_rate=spec['cost_rate'])
+            summary['annual_return'], summary['annual_volatility'], summary['sharpe'] = result.portfolio_metrics
+            summary['benchmark_return'], summary['benchmark_volatility'], summary['benchmark_sharpe'] = result.benchmark_metrics
+            if result.state is not None:
+                state = result.state.to_dict()
+                summary['final_balance'] = sum(result.state.asset_balances)
+                summary['benchmark_final_balance'] = result.state.benchmark_balance
+                summary['rebalances'] = result.state.rebalance_count
+                summary['last_date'] = result.state.last_date
+            else:
+                # drift and cost-aware policies are always simulated in full
+                summary['final_balance'] = result.portfolio_history.iloc[-1]
+                summary['benchmark_final_balance'] = result.benchmark_history.iloc[-1]
+                summary['rebalances'] = len(result.rebalance_dates)
+                summary['last_date'] = result.portfolio_history.index[-1]
+                summary['trading_costs'] = result.trading_costs.sum()
+            history = pd.DataFrame({'name': spec['name'], 'Portfolio': result.portfolio_history, 'Benchmark': result.benchmark_history}).reset_index()
+    except (IndexError, KeyError, ValueError, PriceFetchError) as e:
+        # one bad spec should not sink the rest of the batch
+        summary['error'] = f"{type(e).__name__}: {e}"
+    return summary, history, state
+
+
+def attach_states(specs, states):
+    # resume a simulate job from its saved state only if it still describes the same portfolio; states saved
+    # before they recorded their tickers, benchmark and initial value are simulated again in full
+    for spec in specs:
+        state = states.get(spec['name'])
+        if (spec['job'] == 'simulate' and state and spec['rebalance_policy'] == 'calendar' and not spec['cost_rate']
+                and state['rebalance_period'] == spec['rebalance_period']
+                and state['weights'] == [float(weight) for weight in spec['weights']]
+                and state.get('tickers') == [str(ticker) for ticker in spec['tickers']]
+                and state.get('benchmark') == str(spec['benchmark'])
+                and state.get('initial_value') == float(spec['initial_value'])):
+            spec['state'] = state
+    return specs
+
+
+def run_batch(specs, workers=None):
+    # one concurrent load of every symbol over the widest range any spec asks for; for streamed jobs the
+    # store is only filled, and their workers read it in chunks
+    store = get_price_store()
+    datasets = {}
+    for streamed in [False, True]:
+        group = [spec for spec in specs if _streamed(spec) == streamed]
+        if not group:
+            continue
+        symbols = list(dict.fromkeys(ticker for spec in group for ticker in spec['tickers'] + [spec['benchmark']]))
+        start = min(_job_start(spec) for spec in group)
+        end = max(to_timestamp(spec['end_date'], pd.Timestamp.now().normalize() + pd.Timedelta(days=1)) for spec in group)
+        if streamed:
+            store.fill(symbols, start, end)
+        else:
+            datasets = store.load_many(symbols, start, end)
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(specs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(specs)), initializer=_init_worker,
+                                 initargs=(datasets, store.directory)) as pool:
+            results = list(pool.map(run_job, specs))
+    else:
+        _init_worker(datasets)
+        results = [run_job(spec) for spec in specs]
+
+    summary = pd.DataFrame([summary for summary, _, _ in results])
+    histories = [history for _, history, _ in results if history is not None]
+    histories = pd.concat(histories, ignore_index=True) if histories else pd.DataFrame(columns=['name', 'Date', 'Portfolio', 'Benchmark'])
+    states = {spec['name']: state for spec, (_, _, state) in zip(specs, results) if state is not None}
+    return summary, histories, states
+
+
+def write_table(df, path):
+    if path.endswith('.parquet'):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run portfolio optimization and simulation jobs without the web app.")
+    parser.add_argument('specs', help="JSON, JSON-lines or CSV file of portfolio specs")
+    parser.add_argument('--output', default='results.csv', help="summary table (.csv or .parquet)")
+    parser.add_argument('--histories', help="optional balance histories of simulate jobs (.csv or .parquet)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument('--provider', default='yahoo', help="'yahoo', 'synthetic', or a directory of <ticker>.csv files")
+    parser.add_argument('--store', default=PRICE_STORE_DIR, help="price store directory")
+    parser.add_argument('--state', help="JSON file of simulation states to resume from and update")
+    args = parser.parse_args(argv)
+
+    if args.provider == 'yahoo':
+        provider = YahooProvider()
+    elif args.provider == 'synthetic':
+        provider = SyntheticProvider()
+    else:
+        provider = CSVProvider(args.provider)
+    configure_price_store(args.store, provider)
+
+    specs = read_specs(args.specs)
+    states = {}
+    if args.state and os.path.exists(args.state):
+        with open(args.state) as f:
+            states = json.load(f)
+        attach_states(specs, states)
+
+    summary, histories, new_states = run_batch(specs, args.workers)
+    write_table(summary, args.output)
+    if args.histories:
+        write_table(histories, args.histories)
+    if args.state:
+        with open(args.state, 'w') as f:
+            json.dump({**states, **new_states}, f)
+    failed = int(summary['error'].notna().sum())
+    print(f"{len(summary) - failed} of {len(summary)} jobs succeeded; summary written to {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,145 @@
+"""Reproducible performance benchmarks on synthetic prices (no network).
+
+    python run_benchmarks.py --output bench.jsonl
+    python run_benchmarks.py --tickers 5,50 --years 1,10 --compare bench.jsonl
+
+Every stage is timed across a matrix of universe sizes and history lengths. Results are written as
+one JSON object per line (stage, size, best wall time, peak traced memory, commit), so two runs can
+be compared with --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import PriceStore
+from PortfolioAPI import optimize_prices
+from PortfolioUtils import (load_adj_close, load_price_panel, rebalance_portfolio, simulate_rebalancing,
+                            calculate_cumulative_returns, calculate_metrics)
+
+END_DATE = pd.Timestamp("2024-12-31")
+BENCHMARK = "SYNBENCH"
+
+
+def measure(function, repeats):
+    # best-of-n wall time without tracing, then one traced run for the peak allocation
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_stages(n_tickers, years, max_optimizer_tickers):
+    tickers = [f"SYN{i:04d}" for i in range(n_tickers)]
+    start_date = END_DATE - pd.DateOffset(years=years)
+    weights = np.full(n_tickers, 1 / n_tickers)
+
+    # fill the store once so every timed stage reads from disk, as a warm app would
+    PriceStore.get_price_store().load_many(tickers + [BENCHMARK], start_date, END_DATE)
+    prices, benchmark = load_price_panel(tickers, BENCHMARK, start_date, END_DATE)
+    history, _, _ = simulate_rebalancing(prices, benchmark, 10000, weights, 'monthly')
+
+    stages = {
+        'load_price_panel': lambda: load_price_panel(tickers, BENCHMARK, start_date, END_DATE),
+        'simulate_rebalancing': lambda: simulate_rebalancing(prices, benchmark, 10000, weights, 'monthly'),
+        'rebalance_portfolio': lambda: rebalance_portfolio(tickers, BENCHMARK, 10000, weights, 'monthly', start_date, END_DATE),
+        'calculate_cumulative_returns': lambda: calculate_cumulative_returns(prices, pd.Series(weights, index=prices.columns), 10000),
+        'calculate_metrics': lambda: calculate_metrics(history),
+    }
+    if n_tickers <= max_optimizer_tickers:
+        data = load_adj_close(tickers, start_date, END_DATE)
+        stages['optimizer_pipeline'] = lambda: optimize_prices(data, benchmark, 10000, cache=None, n_jobs=1)
+    return stages, len(prices)
+
+
+def run(ticker_counts, year_counts, repeats, max_optimizer_tickers, seed):
+    commit = git_commit()
+    environment = {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__, 'machine': platform.machine()}
+    with tempfile.TemporaryDirectory() as store_directory:
+        PriceStore.configure_price_store(store_directory, PriceStore.SyntheticProvider(seed=seed))
+        for n_tickers in ticker_counts:
+            for years in year_counts:
+                stages, n_days = benchmark_stages(n_tickers, years, max_optimizer_tickers)
+                for stage, function in stages.items():
+                    wall_time, peak = measure(function, repeats)
+                    yield {
+                        'stage': stage,
+                        'n_tickers': n_tickers,
+                        'years': years,
+                        'n_days': n_days,
+                        'wall_time_s': wall_time,
+                        'peak_memory_mb': peak / 1024 / 1024,
+                        'repeats': repeats,
+                        'seed': seed,
+                        'commit': commit,
+                        **environment,
+                    }
+
+
+def compare(results, baseline_path):
+    baseline = pd.read_json(baseline_path, lines=True)
+    keys = ['stage', 'n_tickers', 'years']
+    merged = pd.DataFrame(results).merge(baseline, on=keys, suffixes=('', '_baseline'))
+    merged['time_ratio'] = merged['wall_time_s'] / merged['wall_time_s_baseline']
+    merged['memory_ratio'] = merged['peak_memory_mb'] / merged['peak_memory_mb_baseline']
+    return merged[keys + ['wall_time_s_baseline', 'wall_time_s', 'time_ratio', 'peak_memory_mb', 'memory_ratio']]
+
+
+def parse_counts(text):
+    return [int(value) for value in text.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the toolkit's compute stages on deterministic synthetic prices.")
+    parser.add_argument('--tickers', type=parse_counts, default=[5, 50, 200, 1000], help="comma-separated universe sizes")
+    parser.add_argument('--years', type=parse_counts, default=[1, 5, 10, 30], help="comma-separated history lengths in years")
+    parser.add_argument('--repeats', type=int, default=3, help="timed runs per stage; the fastest is reported")
+    parser.add_argument('--max-optimizer-tickers', type=int, default=200, help="skip the optimizer pipeline above this many tickers")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write JSON lines here instead of stdout")
+    parser.add_argument('--compare', help="earlier JSON-lines output to compare against")
+    args = parser.parse_args(argv)
+
+    results = []
+    output = open(args.output, 'w') if args.output else None
+    try:
+        for record in run(args.tickers, args.years, args.repeats, args.max_optimizer_tickers, args.seed):
+            results.append(record)
+            line = json.dumps(record)
+            if output:
+                output.write(line + '\n')
+                output.flush()
+            else:
+                print(line, flush=True)
+    finally:
+        if output:
+            output.close()
+
+    if args.compare:
+        with pd.option_context('display.width', 200, 'display.max_rows', None):
+            print(compare(results, args.compare).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Cold-start import cost of the app, broken down by module.
+
+    python run_startup_report.py
+    python run_startup_report.py --output startup.jsonl
+    python run_startup_report.py --compare startup.jsonl
+
+A fresh `python -X importtime` interpreter imports what app.py imports at start-up, then each module
+that StartupUtils.HEAVY_MODULES defers, in that order, as a cold container would. Every import is
+charged to its top-level package. Results are one JSON object per line (group, package, best self
+time over the repeats, commit), so two runs can be compared with --compare.
+"""
+import argparse
+import ast
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from StartupUtils import HEAVY_MODULES
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+GROUP_MARKER = '@@group '
+
+
+def startup_modules(app_path=APP_PATH):
+    # the modules app.py imports at module level, in order
+    modules = []
+    for node in ast.parse(open(app_path).read()).body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(APP_PATH)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure_imports(groups):
+    # {group: {package: self seconds}} plus the interpreter's total wall time, from one cold process
+    lines = []
+    for group, modules in groups.items():
+        lines.append(f"print({GROUP_MARKER + group!r}, file=sys.stderr, flush=True)")
+        lines += [f"import {module}" for module in modules]
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', '\n'.join(['import sys'] + lines)],
+                               capture_output=True, text=True, cwd=os.path.dirname(APP_PATH))
+    wall_time = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+
+    costs, group = {}, 'interpreter'
+    for line in completed.stderr.splitlines():
+        if line.startswith(GROUP_MARKER):
+            group = line[len(GROUP_MARKER):]
+        elif line.startswith('import time:') and '|' in line and 'self [us]' not in line:
+            self_us, _, name = line[len('import time:'):].split('|')
+            package = name.strip().split('.')[0]
+            costs.setdefault(group, {}).setdefault(package, 0.0)
+            costs[group][package] += int(self_us) / 1e6
+    return costs, wall_time
+
+
+def run(repeats):
+    groups = {'startup': startup_modules(), **{module: [module] for module in HEAVY_MODULES}}
+    runs = [measure_imports(groups) for _ in range(repeats)]
+    commit = git_commit()
+    environment = {'python': platform.python_version(), 'machine': platform.machine()}
+
+    records = []
+    for group in ['interpreter'] + list(groups):
+        packages = sorted({package for costs, _ in runs for package in costs.get(group, {})})
+        for package in packages:
+            records.append({'group': group, 'package': package,
+                            'import_time_s': min(costs.get(group, {}).get(package, 0.0) for costs, _ in runs)})
+        records.append({'group': group, 'package': 'total',
+                        'import_time_s': min(sum(costs.get(group, {}).values()) for costs, _ in runs)})
+    records.append({'group': 'process', 'package': 'wall', 'import_time_s': min(wall_time for _, wall_time in runs)})
+    return [{**record, 'repeats': repeats, 'commit': commit, **environment} for record in records]
+
+
+def summary(records, top=8):
+    # each group's total and its most expensive packages
+    table = pd.DataFrame(records)
+    rows = []
+    for group, part in table.groupby('group', sort=False):
+        total = part.loc[part['package'] == 'total', 'import_time_s'].sum() if group != 'process' else part['import_time_s'].sum()
+        largest = part[part['package'] != 'total'].nlargest(top, 'import_time_s')
+        rows.append({'group': group, 'total_s': round(total, 3),
+                     'largest': ', '.join(f"{package} {seconds:.3f}" for package, seconds in zip(largest['package'], largest['import_time_s']))})
+    return pd.DataFrame(rows)
+
+
+def compare(records, baseline_path):
+    baseline = pd.read_json(baseline_path, lines=True)
+    keys = ['group', 'package']
+    merged = pd.DataFrame(records).merge(baseline, on=keys, how='outer', suffixes=('', '_baseline')).fillna({'import_time_s': 0.0, 'import_time_s_baseline': 0.0})
+    merged['change_s'] = merged['import_time_s'] - merged['import_time_s_baseline']
+    merged = merged[merged['package'].isin(['total', 'wall']) | (merged['change_s'].abs() >= 0.005)]
+    return merged[keys + ['import_time_s_baseline', 'import_time_s', 'change_s']]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report the app's cold-start import cost per module.")
+    parser.add_argument('--repeats', type=int, default=3, help="cold interpreters to start; the fastest time per package is reported")
+    parser.add_argument('--output', help="write JSON lines here instead of stdout")
+    parser.add_argument('--compare', help="earlier JSON-lines output to compare against")
+    args = parser.parse_args(argv)
+
+    records = run(args.repeats)
+    lines = '\n'.join(json.dumps(record) for record in records)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(lines + '\n')
+    else:
+        print(lines)
+
+    with pd.option_context('display.width', 200, 'display.max_rows', None, 'display.max_colwidth', 120):
+        print(summary(records).to_string(index=False), file=sys.stderr if not args.output else sys.stdout)
+        if args.compare:
+            print(compare(records, args.compare).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()